@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.db import transaction
+from django.utils import timezone
 from .models import (
     Recipe,
     Ingredient,
@@ -8,16 +10,22 @@ from .models import (
     Favorite,
     CartItem,
     Follow,
+    Job,
 )
+from .indexes import pantry_index
+from .shopping_cart import rebuild_shopping_lists
 
 User = get_user_model()
 
 
 @admin.register(User)
 class CustomUserAdmin(BaseUserAdmin):
-    list_display = ('email', 'username', 'first_name', 'last_name', 'is_staff')
+    list_display = ('email', 'username', 'first_name', 'last_name', 'is_staff',
+                    'recipes_count', 'followers_count')
     search_fields = ('email', 'username', 'first_name', 'last_name')
     list_filter = ('is_staff', 'is_superuser', 'is_active')
+    readonly_fields = ('recipes_count', 'followers_count')
+    show_full_result_count = False
     fieldsets = (
         (None, {'fields': ('email', 'password')}),
         ('Personal info', {'fields': ('username', 'first_name',
@@ -25,6 +33,7 @@ class CustomUserAdmin(BaseUserAdmin):
         ('Permissions', {'fields': ('is_active', 'is_staff', 'is_superuser',
                                     'groups', 'user_permissions')}),
         ('Important dates', {'fields': ('last_login', 'date_joined')}),
+        ('Statistics', {'fields': ('recipes_count', 'followers_count')}),
     )
     add_fieldsets = (
         (None, {
@@ -39,51 +48,99 @@ class CustomUserAdmin(BaseUserAdmin):
 class RecipeIngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 1
+    autocomplete_fields = ('ingredient',)
     verbose_name = 'Ингредиент в рецепте'
     verbose_name_plural = 'Ингредиенты в рецепте'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'favorites_count')
+    list_display = ('title', 'author', 'favorites_count', 'cart_count')
+    list_select_related = ('author',)
     search_fields = ('title', 'author__username')
-    readonly_fields = ('favorites_count',)
+    autocomplete_fields = ('author',)
+    readonly_fields = ('favorites_count', 'cart_count')
+    show_full_result_count = False
     inlines = (RecipeIngredientInline,)
 
-    def favorites_count(self, obj):
-        return obj.in_favorites.count()
-    favorites_count.short_description = 'Добавлено в избранное'
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'unit')
     search_fields = ('name',)
+    show_full_result_count = False
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient', 'amount')
-    search_fields = ('recipe__name', 'ingredient__name')
-    list_filter = ('recipe',)
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__title', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
+    show_full_result_count = False
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        # Массовое удаление обходит приращения списков покупок,
+        # дату изменения рецептов и индекс подбора по продуктам.
+        recipes = set(queryset.values_list('recipe_id', flat=True))
+        users = set(CartItem.objects.filter(
+            recipe__in=recipes
+        ).values_list('user_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_shopping_lists(users)
+        Recipe.objects.filter(pk__in=recipes).update(
+            updated_at=timezone.now()
+        )
+        for recipe_id in recipes:
+            pantry_index.update_on_commit(recipe_id)
 
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe', 'added_at')
-    search_fields = ('user__username', 'recipe__name')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__title')
     list_filter = ('added_at',)
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(CartItem)
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe', 'added_at')
-    search_fields = ('user__username', 'recipe__name')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__title')
     list_filter = ('added_at',)
+    autocomplete_fields = ('user', 'recipe')
+    show_full_result_count = False
 
 
 @admin.register(Follow)
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author', 'created_at')
+    list_select_related = ('user', 'author')
     search_fields = ('user__username', 'author__username')
     list_filter = ('created_at',)
+    autocomplete_fields = ('user', 'author')
+    show_full_result_count = False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'attempts', 'run_at', 'locked_by')
+    list_filter = ('status',)
+    search_fields = ('task',)
+    readonly_fields = ('locked_at', 'locked_by', 'last_error', 'created_at')
+    show_full_result_count = False
+    actions = ('retry',)
+
+    @admin.action(description='Повторить выбранные задачи')
+    def retry(self, request, queryset):
+        queryset.update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(),
+            locked_at=None, locked_by=''
+        )
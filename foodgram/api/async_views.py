@@ -0,0 +1,310 @@
+"""
+Асинхронные представления для самых нагруженных чтений (ASGI, uvicorn).
+
+Подключаются вместо маршрутов DRF при ASYNC_READ_VIEWS. Обрабатывают
+только GET/HEAD: остальные методы и неподдерживаемые варианты (курсорная
+пагинация, детальная страница ингредиента) передаются синхронному
+представлению DRF. Данные читаются асинхронным ORM, а сериализаторы
+работают только с уже загруженными объектами и в БД не ходят.
+"""
+from functools import wraps
+from math import ceil
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.translation import gettext as _
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .authentication import CachedTokenAuthentication
+from .cache import (
+    CATALOG_VERSION, LIST_VERSION, RECIPE_VERSION, USER_STATE_VERSION,
+    USER_VERSION, aget_version, detail_key, list_key
+)
+from .conditional import make_etag, not_modified, set_validators
+from .filters import RecipeFilter
+from .indexes import ingredient_index
+from .models import Recipe
+from .pagination import LimitPageNumberPagination
+from .routers import choose_replica, is_pinned, reset_replica, use_replica
+from .serializers import IngredientSerializer, RecipeReadSerializer
+from .views import (
+    IngredientViewSet, RecipeViewSet, annotate_recipes,
+    recipe_detail_validators, recipe_list_validators
+)
+
+READ_METHODS = ('GET', 'HEAD')
+
+recipe_list_view = RecipeViewSet.as_view({'get': 'list', 'post': 'create'})
+recipe_detail_view = RecipeViewSet.as_view({
+    'get': 'retrieve',
+    'put': 'update',
+    'patch': 'partial_update',
+    'delete': 'destroy',
+})
+ingredient_list_view = IngredientViewSet.as_view({'get': 'list'})
+
+
+def json_response(data, status=200, headers=None):
+    return HttpResponse(
+        JSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+        headers=headers,
+    )
+
+
+def error_response(exc):
+    headers = None
+    if isinstance(exc, (exceptions.NotAuthenticated,
+                        exceptions.AuthenticationFailed)):
+        headers = {'WWW-Authenticate': CachedTokenAuthentication.keyword}
+    data = (
+        exc.detail if isinstance(exc.detail, (list, dict))
+        else {'detail': exc.detail}
+    )
+    return json_response(data, exc.status_code, headers)
+
+
+def cached_response(request, entry):
+    data, etag, timestamp = entry
+    if etag is None:
+        return json_response(data)
+    return set_validators(
+        not_modified(request, etag, timestamp) or json_response(data),
+        etag, timestamp
+    )
+
+
+async def conditional(request, validators, build):
+    """
+    Аналог ConditionalGetMixin: 304, если валидаторы клиента совпали,
+    иначе ответ с данными `await build()`. Возвращает ответ и запись
+    для кэша — None, если тело не строилось.
+    """
+    if validators is None:
+        data = await build()
+        return json_response(data), (data, None, None)
+    etag, last_modified = validators
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = not_modified(request, etag, timestamp)
+    if response is not None:
+        return set_validators(response, etag, timestamp), None
+    data = await build()
+    entry = (data, etag, timestamp)
+    return set_validators(json_response(data), etag, timestamp), entry
+
+
+async def list_validators(request):
+    state_version = None
+    if not request.user.is_anonymous:
+        state_version = await aget_version(
+            USER_STATE_VERSION.format(pk=request.user.pk)
+        )
+    return recipe_list_validators(
+        request, await aget_version(LIST_VERSION), state_version
+    )
+
+
+async def authenticate(request):
+    """То же, что CachedTokenAuthentication, но через асинхронный ORM."""
+    header = request.headers.get('Authorization', '').split()
+    backend = CachedTokenAuthentication()
+    if not header or header[0].lower() != backend.keyword.lower():
+        return AnonymousUser()
+    if len(header) != 2:
+        raise exceptions.AuthenticationFailed(
+            _('Invalid token header. Token string should not contain spaces.')
+        )
+    user, _token = await backend.aauthenticate_credentials(header[1])
+    return user
+
+
+def async_read(sync_view, delegate_if=None):
+    """
+    Оборачивает асинхронный обработчик чтения: аутентификация, выбор
+    реплики и ответы об ошибках в формате DRF. Прочие методы и запросы,
+    для которых `delegate_if(request)` истинно, обслуживает `sync_view`.
+    """
+    delegate = sync_to_async(sync_view)
+
+    def decorator(handler):
+        @csrf_exempt
+        @wraps(handler)
+        async def view(request, *args, **kwargs):
+            if request.method not in READ_METHODS or (
+                delegate_if is not None and delegate_if(request)
+            ):
+                return await delegate(request, *args, **kwargs)
+            try:
+                request.user = await authenticate(request)
+                token = None
+                if not is_pinned(request):
+                    alias = choose_replica()
+                    if alias is not None:
+                        token = use_replica(alias)
+                try:
+                    return await handler(request, *args, **kwargs)
+                finally:
+                    if token is not None:
+                        reset_replica(token)
+            except exceptions.APIException as exc:
+                return error_response(exc)
+        return view
+    return decorator
+
+
+def get_page_size(request):
+    pagination = LimitPageNumberPagination
+    try:
+        size = int(request.GET[pagination.page_size_query_param])
+    except (KeyError, ValueError):
+        return pagination.page_size
+    return size if size > 0 else pagination.page_size
+
+
+async def recipe_page(request):
+    """Страница рецептов в формате LimitPageNumberPagination."""
+    queryset = annotate_recipes(
+        RecipeViewSet.queryset.all(), request.user
+    )
+    filterset = RecipeFilter(request.GET, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        raise exceptions.ValidationError(filterset.errors)
+    queryset = filterset.qs
+    size = get_page_size(request)
+    count = await queryset.acount()
+    pages = max(ceil(count / size), 1)
+    number = request.GET.get('page', 1)
+    try:
+        number = pages if number == 'last' else int(number)
+    except ValueError:
+        number = 0
+    if not 1 <= number <= pages:
+        raise exceptions.NotFound(
+            LimitPageNumberPagination.invalid_page_message.format(
+                page_number=number, message=''
+            )
+        )
+    offset = (number - 1) * size
+    recipes = [
+        recipe async for recipe in
+        queryset[offset:offset + size].aiterator(chunk_size=size)
+    ]
+    url = request.build_absolute_uri()
+    previous = None
+    if number == 2:
+        previous = remove_query_param(url, 'page')
+    elif number > 2:
+        previous = replace_query_param(url, 'page', number - 1)
+    return {
+        'count': count,
+        'next': (
+            replace_query_param(url, 'page', number + 1)
+            if number < pages else None
+        ),
+        'previous': previous,
+        'results': RecipeReadSerializer(
+            recipes, many=True,
+            context={'request': request, 'action': 'list'}
+        ).data,
+    }
+
+
+@async_read(recipe_list_view, delegate_if=lambda request: (
+    'cursor' in request.GET
+))
+async def recipe_list(request):
+    if not request.user.is_anonymous:
+        response, _entry = await conditional(
+            request, await list_validators(request),
+            lambda: recipe_page(request)
+        )
+        return response
+    key = list_key(await aget_version(LIST_VERSION), request)
+    entry = await cache.aget(key)
+    if entry is not None:
+        return cached_response(request, entry)
+    response, entry = await conditional(
+        request, await list_validators(request),
+        lambda: recipe_page(request)
+    )
+    if entry is not None:
+        await cache.aset(key, entry, settings.RECIPE_CACHE_TIMEOUT)
+    return response
+
+
+async def load_recipe(request, pk):
+    try:
+        recipe = await annotate_recipes(
+            Recipe.objects.all(), request.user
+        ).aget(pk=pk)
+    except Recipe.DoesNotExist:
+        raise exceptions.NotFound('No Recipe matches the given query.')
+    return RecipeReadSerializer(
+        recipe, context={'request': request, 'action': 'retrieve'}
+    ).data
+
+
+@async_read(recipe_detail_view)
+async def recipe_detail(request, pk):
+    # Валидаторы учитывают снимок индекса ингредиентов, который строится
+    # синхронно, — считаем их вне цикла событий.
+    validators = sync_to_async(recipe_detail_validators)
+    if not request.user.is_anonymous:
+        response, _entry = await conditional(
+            request, await validators(request, pk),
+            lambda: load_recipe(request, pk)
+        )
+        return response
+    key = detail_key(
+        pk,
+        await aget_version(CATALOG_VERSION),
+        await aget_version(RECIPE_VERSION.format(pk=pk)),
+        request,
+    )
+    cached = await cache.aget(key)
+    if cached is not None:
+        author_id, author_version, entry = cached
+        current = await aget_version(USER_VERSION.format(pk=author_id))
+        if current == author_version:
+            return cached_response(request, entry)
+    response, entry = await conditional(
+        request, await validators(request, pk),
+        lambda: load_recipe(request, pk)
+    )
+    if entry is not None:
+        author_id = entry[0]['author']['id']
+        await cache.aset(
+            key,
+            (
+                author_id,
+                await aget_version(USER_VERSION.format(pk=author_id)),
+                entry,
+            ),
+            settings.RECIPE_CACHE_TIMEOUT
+        )
+    return response
+
+
+@async_read(ingredient_list_view)
+async def ingredient_list(request):
+    if request.user.is_anonymous:
+        raise exceptions.NotAuthenticated()
+    # Снимок индекса строится из БД — только вне цикла событий.
+    snapshot = await sync_to_async(ingredient_index.get)()
+    keys, _, last_modified = snapshot
+    etag = make_etag(request, len(keys), last_modified)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = not_modified(request, etag, timestamp)
+    if response is None:
+        prefix = request.GET.get('name') or request.GET.get('search', '')
+        response = json_response(IngredientSerializer(
+            ingredient_index.search(prefix, snapshot), many=True
+        ).data)
+    return set_validators(response, etag, timestamp)
@@ -0,0 +1,146 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext as _
+from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .lru import LRUCache
+
+User = get_user_model()
+
+TOKEN_KEY = 'auth:token:{key}'
+
+# Поля пользователя, которые хранятся вместе с токеном. Хэш пароля,
+# счётчики и даты в кэш не попадают: при обращении они читаются из базы.
+# Порядок — как у полей модели: в нём значения ожидает Model.from_db().
+USER_FIELDS = tuple(
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {
+        'id', 'email', 'username', 'first_name', 'last_name', 'avatar',
+        'is_active', 'is_staff', 'is_superuser'
+    }
+)
+
+# Первый уровень — память процесса: короткий TTL ограничивает время,
+# в течение которого другие воркеры не видят выхода или блокировки.
+token_cache = LRUCache(
+    settings.AUTH_TOKEN_CACHE_SIZE, ttl=settings.AUTH_TOKEN_LOCAL_TTL
+)
+
+
+def token_entry(token):
+    return tuple(
+        User._meta.get_field(name).get_prep_value(getattr(token.user, name))
+        for name in USER_FIELDS
+    )
+
+
+def entry_token(key, entry):
+    """Токен и пользователь из записи кэша: каждому запросу — свои."""
+    user = User.from_db(None, USER_FIELDS, entry)
+    token = Token.from_db(None, ('key', 'user_id'), (key, user.pk))
+    token.user = user
+    return token
+
+
+def cached_token(key):
+    entry = token_cache.get(key)
+    if entry is None:
+        entry = cache.get(TOKEN_KEY.format(key=key))
+        if entry is not None:
+            token_cache.set(key, entry)
+    return entry
+
+
+async def acached_token(key):
+    entry = token_cache.get(key)
+    if entry is None:
+        entry = await cache.aget(TOKEN_KEY.format(key=key))
+        if entry is not None:
+            token_cache.set(key, entry)
+    return entry
+
+
+def remember_token(token):
+    entry = token_entry(token)
+    token_cache.set(token.key, entry)
+    cache.set(
+        TOKEN_KEY.format(key=token.key), entry,
+        settings.AUTH_TOKEN_CACHE_TIMEOUT
+    )
+
+
+async def aremember_token(token):
+    entry = token_entry(token)
+    token_cache.set(token.key, entry)
+    await cache.aset(
+        TOKEN_KEY.format(key=token.key), entry,
+        settings.AUTH_TOKEN_CACHE_TIMEOUT
+    )
+
+
+def forget_tokens(keys):
+    keys = list(keys)
+
+    def forget():
+        for key in keys:
+            token_cache.delete(key)
+        cache.delete_many([TOKEN_KEY.format(key=key) for key in keys])
+    if keys:
+        transaction.on_commit(forget)
+
+
+def check_active(token):
+    if not token.user.is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    return token.user, token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication, который хранит токен вместе с полями пользователя
+    в памяти процесса и в общем кэше. Записи сбрасываются сигналами
+    при выходе, смене пароля, блокировке и удалении пользователя.
+    Кэш обслуживает только чтение: изменяющие запросы получают
+    пользователя из базы, иначе save() записал бы устаревшие поля.
+    """
+
+    use_cache = True
+
+    def authenticate(self, request):
+        self.use_cache = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        entry = cached_token(key) if self.use_cache else None
+        if entry is None:
+            user, token = super().authenticate_credentials(key)
+            remember_token(token)
+            return user, token
+        return check_active(entry_token(key, entry))
+
+    async def aauthenticate_credentials(self, key):
+        entry = await acached_token(key)
+        if entry is not None:
+            token = entry_token(key, entry)
+        else:
+            model = self.get_model()
+            try:
+                token = await model.objects.select_related('user').aget(
+                    key=key
+                )
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if token.user.is_active:
+                await aremember_token(token)
+        return check_active(token)
+
+
+def forget_user_tokens(user_id):
+    forget_tokens(
+        Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    )
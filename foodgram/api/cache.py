@@ -0,0 +1,160 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_http_date
+from rest_framework.response import Response
+
+from .conditional import not_modified, set_validators
+
+# Версии ключей кэша. Изменение данных увеличивает версию, и старые
+# записи перестают находиться — явно удалять их не нужно.
+LIST_VERSION = 'recipes:list:version'
+CATALOG_VERSION = 'recipes:catalog:version'
+RECIPE_VERSION = 'recipes:{pk}:version'
+USER_VERSION = 'users:{pk}:version'
+# Избранное, покупки и подписки пользователя — флаги в его ответах.
+USER_STATE_VERSION = 'users:{pk}:state:version'
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # После вытеснения версия начинается с текущего времени, а не с 1,
+        # чтобы не совпасть со старыми записями.
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_on_commit(*keys):
+    def bump():
+        for key in keys:
+            bump_version(key)
+    transaction.on_commit(bump)
+
+
+def invalidate_recipe(recipe_id):
+    bump_on_commit(RECIPE_VERSION.format(pk=recipe_id), LIST_VERSION)
+
+
+def invalidate_user(user_id):
+    bump_on_commit(USER_VERSION.format(pk=user_id), LIST_VERSION)
+
+
+def invalidate_user_state(user_id):
+    bump_on_commit(USER_STATE_VERSION.format(pk=user_id))
+
+
+def invalidate_catalog():
+    bump_on_commit(CATALOG_VERSION, LIST_VERSION)
+
+
+def request_fingerprint(request):
+    # Хост и схема входят в ключ: URL изображений абсолютные.
+    params = sorted(request.GET.lists())
+    raw = f'{request.scheme}://{request.get_host()}?{params}'
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def list_key(list_version, request):
+    return f'recipes:list:{list_version}:{request_fingerprint(request)}'
+
+
+def detail_key(pk, catalog_version, recipe_version, request):
+    return (
+        f'recipes:detail:{pk}:{catalog_version}:{recipe_version}:'
+        f'{request_fingerprint(request)}'
+    )
+
+
+def cache_entry(response):
+    """Данные ответа вместе с валидаторами ETag/Last-Modified."""
+    last_modified = response.get('Last-Modified')
+    return (
+        response.data,
+        response.get('ETag'),
+        parse_http_date(last_modified) if last_modified else None,
+    )
+
+
+def cached_response(request, entry):
+    data, etag, timestamp = entry
+    if etag is None:
+        return Response(data)
+    return set_validators(
+        not_modified(request, etag, timestamp) or Response(data),
+        etag, timestamp
+    )
+
+
+class AnonymousRecipeCacheMixin:
+    """
+    Кэширует ответы list/retrieve для анонимных пользователей: для них
+    is_favorited и is_in_shopping_cart всегда False и JSON одинаков.
+    Вместе с телом хранятся ETag и Last-Modified, так что повторный
+    условный запрос тоже обходится без БД.
+    """
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().list(request, *args, **kwargs)
+        key = list_key(get_version(LIST_VERSION), request)
+        entry = cache.get(key)
+        if entry is not None:
+            return cached_response(request, entry)
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(
+                key, cache_entry(response), settings.RECIPE_CACHE_TIMEOUT
+            )
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return super().retrieve(request, *args, **kwargs)
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        key = detail_key(
+            pk,
+            get_version(CATALOG_VERSION),
+            get_version(RECIPE_VERSION.format(pk=pk)),
+            request,
+        )
+        # Вместе с ответом хранится версия автора, которую можно узнать
+        # только после загрузки рецепта.
+        cached = cache.get(key)
+        if cached is not None:
+            author_id, author_version, entry = cached
+            current = get_version(USER_VERSION.format(pk=author_id))
+            if current == author_version:
+                return cached_response(request, entry)
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            author_id = response.data['author']['id']
+            cache.set(
+                key,
+                (
+                    author_id,
+                    get_version(USER_VERSION.format(pk=author_id)),
+                    cache_entry(response),
+                ),
+                settings.RECIPE_CACHE_TIMEOUT
+            )
+        return response
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # Версии ключей кэша, ETag списков и кэш токенов должны быть общими
+    # для всех воркеров gunicorn и фоновых задач.
+    backend = settings.CACHES['default']['BACKEND']
+    if backend.endswith('.LocMemCache'):
+        return [Warning(
+            'Кэш по умолчанию хранится в памяти процесса: воркеры не видят '
+            'изменений друг друга и отдают устаревшие ответы и ETag.',
+            hint='Задайте CACHE_DIR на общем для воркеров томе.',
+            id='api.W001',
+        )]
+    return []
+
+
+@register(deploy=True)
+def check_metrics_dir(app_configs, **kwargs):
+    if not settings.METRICS_DIR:
+        return [Warning(
+            'Метрики хранятся в памяти процесса: /api/_metrics отдаёт '
+            'счётчики случайного воркера gunicorn.',
+            hint='Задайте METRICS_DIR — общий для воркеров каталог.',
+            id='api.W002',
+        )]
+    return []
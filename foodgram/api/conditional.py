@@ -0,0 +1,72 @@
+import hashlib
+
+from django.utils.cache import (
+    get_conditional_response, patch_vary_headers, quote_etag
+)
+from django.utils.http import http_date
+
+
+def make_etag(request, *parts):
+    # Хост и схема влияют на абсолютные URL в теле ответа.
+    raw = repr((request.build_absolute_uri(), parts))
+    return quote_etag(hashlib.sha256(raw.encode()).hexdigest())
+
+
+def not_modified(request, etag, timestamp):
+    """304-ответ, если валидаторы клиента совпадают, иначе None."""
+    return get_conditional_response(
+        request, etag=etag, last_modified=timestamp
+    )
+
+
+def set_validators(response, etag, timestamp):
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для list/retrieve.
+
+    Валидаторы считаются дешёвым запросом до сериализации; если клиент
+    прислал совпадающие If-None-Match/If-Modified-Since, сразу отдаём 304.
+    Наследник реализует get_list_validators/get_detail_validators,
+    возвращающие пару (etag, last_modified) или None.
+    """
+
+    def get_list_validators(self, request):
+        return None
+
+    def get_detail_validators(self, request, pk):
+        return None
+
+    def conditional_response(self, request, validators, view, *args,
+                             **kwargs):
+        if validators is None:
+            return view(request, *args, **kwargs)
+        etag, last_modified = validators
+        timestamp = (
+            int(last_modified.timestamp()) if last_modified else None
+        )
+        response = not_modified(request, etag, timestamp)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        return set_validators(response, etag, timestamp)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.get_list_validators(request),
+            super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.conditional_response(
+            request, self.get_detail_validators(request, pk),
+            super().retrieve, *args, **kwargs
+        )
@@ -0,0 +1,53 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import CartItem, Favorite, Follow, Recipe
+
+User = get_user_model()
+
+# Модель-источник → (модель со счётчиком, поле внешнего ключа, счётчик).
+COUNTERS = {
+    Favorite: (Recipe, 'recipe', 'favorites_count'),
+    CartItem: (Recipe, 'recipe', 'cart_count'),
+    Follow: (User, 'author', 'followers_count'),
+    Recipe: (User, 'author', 'recipes_count'),
+}
+
+
+def change_counter(instance, delta):
+    """Атомарно сдвигает денормализованный счётчик на delta через F()."""
+    model, field, counter = COUNTERS[type(instance)]
+    model.objects.filter(pk=getattr(instance, f'{field}_id')).update(**{
+        counter: Greatest(F(counter) + delta, 0)
+    })
+
+
+def actual_count(source, field):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(total=Count('pk')).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def recount():
+    """
+    Пересчитывает все счётчики массовыми UPDATE с подзапросами.
+    Возвращает число затронутых строк по моделям.
+    """
+    updated = {}
+    for model in (Recipe, User):
+        counters = {
+            counter: actual_count(source, field)
+            for source, (target, field, counter) in COUNTERS.items()
+            if target is model
+        }
+        updated[model._meta.verbose_name_plural] = model.objects.update(
+            **counters
+        )
+    return updated
@@ -0,0 +1,144 @@
+"""
+Лента подписок: рецепты авторов, на которых подписан пользователь.
+
+Новый рецепт раскладывается по лентам подписчиков (FeedEntry) фоновой
+задачей — fan-out on write. У популярных авторов (больше
+FEED_FANOUT_MAX_FOLLOWERS подписчиков) раскладка обошлась бы в тысячи
+строк на рецепт, поэтому их рецепты читаются из api_recipe при запросе
+ленты и сливаются с таблицей ленты по ключу (pub_date, id).
+Решение принимается один раз, при публикации, и хранится в флаге
+Recipe.fanned_out: рецепт не пропадёт из лент, когда число подписчиков
+автора перейдёт порог в любую сторону.
+При подписке в ленту сразу попадают последние рецепты автора,
+при отписке его рецепты из ленты удаляются.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .jobs import enqueue
+from .models import FeedEntry, Follow, Recipe
+
+User = get_user_model()
+
+
+def is_popular(followers_count):
+    return followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def schedule_fan_out(recipe):
+    enqueue(fan_out, recipe.pk)
+
+
+def fan_out(recipe_id, after=0):
+    """
+    Раскладывает рецепт по лентам подписчиков с id больше `after`,
+    не больше FEED_FANOUT_BATCH за задачу: остаток уходит следующей
+    задачей, и крупную раскладку делят между собой потоки воркера.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).values_list(
+        'author_id', 'pub_date', 'author__followers_count'
+    ).first()
+    if recipe is None:
+        return
+    author_id, pub_date, followers_count = recipe
+    if not after and is_popular(followers_count):
+        return
+    followers = list(
+        Follow.objects.filter(author_id=author_id, user_id__gt=after)
+        .order_by('user_id')
+        .values_list('user_id', flat=True)[:settings.FEED_FANOUT_BATCH]
+    )
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id in followers
+        ),
+        ignore_conflicts=True
+    )
+    if len(followers) == settings.FEED_FANOUT_BATCH:
+        enqueue(fan_out, recipe_id, after=followers[-1])
+    else:
+        # Флаг — только после последней пачки: до этого рецепт читается
+        # из api_recipe, а повторы с уже разложенными строками ленты
+        # схлопывает FeedPagination.
+        Recipe.objects.filter(pk=recipe_id).update(fanned_out=True)
+
+
+def backfill_feed(user_id, author_id):
+    """
+    Последние FEED_BACKFILL_SIZE рецептов автора — в ленту подписчика.
+    Берутся и неразложенные: подписчик мог появиться позади идущей
+    раскладки, а повторы при чтении схлопываются.
+    """
+    recipes = Recipe.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        ),
+        ignore_conflicts=True
+    )
+
+
+def rebuild_feeds():
+    """
+    Заполняет ленты заново, как если бы все подписки были новыми;
+    рецепты популярных авторов снова читаются при запросе ленты.
+    """
+    FeedEntry.objects.all().delete()
+    popular = User.objects.filter(
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    )
+    Recipe.objects.filter(author__in=popular).update(fanned_out=False)
+    Recipe.objects.exclude(author__in=popular).update(fanned_out=True)
+    authors = User.objects.filter(
+        followers_count__gt=0,
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('pk', flat=True)
+    for author_id in authors.iterator():
+        recipes = list(
+            Recipe.objects.filter(author_id=author_id).order_by(
+                '-pub_date', '-id'
+            ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+        )
+        followers = Follow.objects.filter(author_id=author_id).values_list(
+            'user_id', flat=True
+        )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id, pub_date=pub_date
+                )
+                for user_id in followers.iterator()
+                for recipe_id, pub_date in recipes
+            ),
+            batch_size=settings.FEED_FANOUT_BATCH
+        )
+
+
+def forget_author(user_id, author_id):
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def feed_sources(user):
+    """
+    Источники ленты для FeedPagination: пары (запрос, поля ключа).
+    Авторы с неразложенными рецептами выбираются отдельным запросом
+    по частичному индексу, чтобы без них не строить слияние вовсе.
+    """
+    sources = [(FeedEntry.objects.filter(user=user), ('pub_date', 'recipe'))]
+    authors = list(
+        Follow.objects.filter(
+            user=user, author__recipes__fanned_out=False
+        ).values_list('author_id', flat=True).distinct()
+    )
+    if authors:
+        sources.append((
+            Recipe.objects.filter(author_id__in=authors, fanned_out=False),
+            ('pub_date', 'id')
+        ))
+    return sources
@@ -0,0 +1,77 @@
+from django.conf import settings
+from drf_extra_fields.fields import Base64ImageField
+from rest_framework import serializers
+
+from .images import variant_url
+
+
+class LimitedBase64ImageField(Base64ImageField):
+    """
+    Base64ImageField с ограничением размера файла и числа пикселей.
+    Размер проверяется по длине строки ещё до декодирования base64.
+    """
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+        'too_many_pixels': (
+            'Изображение не должно содержать больше {max_pixels} пикселей.'
+        ),
+    }
+
+    def to_internal_value(self, data):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if isinstance(data, str):
+            encoded = data.rpartition(';base64,')[2]
+            if len(encoded) * 3 // 4 > max_size:
+                self.fail('too_large', max_size=max_size)
+        file = super().to_internal_value(data)
+        # Django уже открыл изображение и прочитал только заголовок.
+        image = getattr(file, 'image', None)
+        max_pixels = settings.RECIPE_IMAGE_MAX_PIXELS
+        if image is not None and image.width * image.height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
+        return file
+
+
+class RecipeImageField(serializers.Field):
+    """
+    URL уменьшенной копии изображения рецепта. Без явного `variant`
+    копия выбирается по действию представления: list — 'list',
+    остальные — 'detail'.
+    """
+
+    def __init__(self, variant=None, **kwargs):
+        self.variant = variant
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_variant(self):
+        if self.variant:
+            return self.variant
+        action = self.context.get(
+            'action', getattr(self.context.get('view'), 'action', None)
+        )
+        return 'list' if action == 'list' else 'detail'
+
+    def build_url(self, url):
+        request = self.context.get('request')
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def to_representation(self, recipe):
+        return self.build_url(variant_url(recipe, self.get_variant()))
+
+
+class RecipeImageVariantsField(RecipeImageField):
+    """Все копии изображения рецепта и исходник: {имя: URL}."""
+
+    def to_representation(self, recipe):
+        names = ('original', *settings.RECIPE_IMAGE_VARIANTS)
+        return {
+            name: self.build_url(
+                recipe.image.url if name == 'original' and recipe.image
+                else variant_url(recipe, name)
+            )
+            for name in names
+        }
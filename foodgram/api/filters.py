@@ -0,0 +1,41 @@
+from django.db.models import Exists, OuterRef
+from django_filters import rest_framework as filters
+
+from .models import CartItem, Favorite, Recipe
+from .search import search_recipes
+
+
+class RecipeFilter(filters.FilterSet):
+    """
+    /api/recipes/?author=&is_favorited=0|1&is_in_shopping_cart=0|1&search=
+
+    Флаги фильтруются подзапросами EXISTS по индексам (user, recipe);
+    search — полнотекстовый поиск с сортировкой по релевантности.
+    """
+    author = filters.NumberFilter(field_name='author_id')
+    is_favorited = filters.BooleanFilter(method='filter_related_exists')
+    is_in_shopping_cart = filters.BooleanFilter(
+        method='filter_related_exists'
+    )
+    search = filters.CharFilter(method='filter_search')
+
+    RELATED_MODELS = {
+        'is_favorited': Favorite,
+        'is_in_shopping_cart': CartItem,
+    }
+
+    class Meta:
+        model = Recipe
+        fields = ('author', 'is_favorited', 'is_in_shopping_cart', 'search')
+
+    def filter_related_exists(self, queryset, name, value):
+        user = self.request.user
+        if user.is_anonymous:
+            return queryset.none() if value else queryset
+        exists = Exists(self.RELATED_MODELS[name].objects.filter(
+            user=user, recipe=OuterRef('pk')
+        ))
+        return queryset.filter(exists if value else ~exists)
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
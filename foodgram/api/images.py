@@ -0,0 +1,92 @@
+import io
+from pathlib import PurePosixPath
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .cache import invalidate_recipe
+from .jobs import enqueue
+from .models import Recipe
+
+VARIANTS_DIR = 'recipes/variants'
+
+
+def variant_format():
+    # WebP заметно меньше JPEG, но Pillow может быть собран без libwebp.
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def encode(image, image_format):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, quality=settings.RECIPE_IMAGE_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_variants(recipe_id, original):
+    """
+    Строит уменьшенные копии изображения рецепта и сохраняет их пути
+    в Recipe.image_variants. Копии считаются от большей к меньшей,
+    чтобы исходник декодировался и масштабировался один раз.
+    """
+    image_format, extension = variant_format()
+    stem = PurePosixPath(original).stem
+    sizes = sorted(
+        settings.RECIPE_IMAGE_VARIANTS.items(),
+        key=lambda item: item[1][0] * item[1][1],
+        reverse=True
+    )
+    variants = {}
+    with default_storage.open(original) as source:
+        with Image.open(source) as image:
+            image.draft('RGB', sizes[0][1])
+            image = ImageOps.exif_transpose(image)
+            for name, size in sizes:
+                image.thumbnail(size)
+                variants[name] = default_storage.save(
+                    f'{VARIANTS_DIR}/{recipe_id}/{stem}_{name}.{extension}',
+                    encode(image, image_format)
+                )
+    updated = Recipe.objects.filter(pk=recipe_id, image=original).update(
+        image_variants=variants, updated_at=timezone.now()
+    )
+    if not updated:
+        # Рецепт удалён или изображение успели заменить.
+        delete_files(variants.values())
+        return
+    # .update() не вызывает сигналы — сбрасываем кэш ответов сами.
+    invalidate_recipe(recipe_id)
+
+
+def delete_files(paths):
+    for path in paths:
+        default_storage.delete(path)
+
+
+def process_image(recipe_id, original, stale=()):
+    delete_files(stale)
+    generate_variants(recipe_id, original)
+
+
+def schedule_variants(recipe, stale=()):
+    """
+    Ставит построение копий в очередь фоновых задач;
+    `stale` — пути копий предыдущего изображения, их удаляем там же.
+    """
+    enqueue(process_image, recipe.pk, recipe.image.name, list(stale))
+
+
+def variant_url(recipe, name):
+    """URL копии `name`; пока копий нет — URL исходника."""
+    path = (recipe.image_variants or {}).get(name)
+    if path:
+        return default_storage.url(path)
+    return recipe.image.url if recipe.image else None
@@ -0,0 +1,307 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Ingredient, RecipeIngredient
+
+
+class ProcessLocalIndex:
+    """
+    Индекс в памяти процесса, который лениво строится из БД.
+
+    Сигналы модели сбрасывают индекс в текущем процессе, а `ttl` ограничивает
+    время жизни копий в остальных воркерах.
+    """
+    ttl = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+        self._built_at = 0.0
+
+    def build(self):
+        raise NotImplementedError
+
+    def _expired(self):
+        return (
+            self.ttl is not None
+            and time.monotonic() - self._built_at > self.ttl
+        )
+
+    def get(self):
+        data = self._data
+        if data is None or self._expired():
+            with self._lock:
+                if self._data is None or self._expired():
+                    self._data = self.build()
+                    self._built_at = time.monotonic()
+                data = self._data
+        return data
+
+    def invalidate(self):
+        self._data = None
+
+
+class IngredientPrefixIndex(ProcessLocalIndex):
+    """Отсортированный массив названий ингредиентов для поиска по префиксу."""
+
+    @property
+    def ttl(self):
+        return settings.INGREDIENT_INDEX_TTL
+
+    def build(self):
+        rows = Ingredient.objects.order_by().values_list(
+            'id', 'name', 'unit', 'updated_at'
+        )
+        ingredients = []
+        last_modified = None
+        for pk, name, unit, updated_at in rows:
+            ingredients.append(Ingredient(
+                id=pk, name=name, unit=unit, updated_at=updated_at
+            ))
+            if last_modified is None or updated_at > last_modified:
+                last_modified = updated_at
+        ingredients.sort(
+            key=lambda ingredient: (ingredient.name.casefold(), ingredient.pk)
+        )
+        keys = [ingredient.name.casefold() for ingredient in ingredients]
+        return keys, ingredients, last_modified
+
+    @property
+    def last_modified(self):
+        """Время последнего изменения справочника в текущем снимке."""
+        return self.get()[2]
+
+    def search(self, prefix='', snapshot=None):
+        keys, ingredients, _ = snapshot or self.get()
+        if not prefix:
+            return ingredients
+        prefix = prefix.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(0x10FFFF), start)
+        return ingredients[start:end]
+
+
+ingredient_index = IngredientPrefixIndex()
+
+
+def to_bitmap(positions):
+    """Битовая карта (целое) с установленными битами `positions`."""
+    bits = bytearray(max(positions) // 8 + 1)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def group_bitmaps(keys):
+    """{ключ: битовая карта позиций} для последовательности ключей."""
+    postings = defaultdict(list)
+    for position, key in enumerate(keys):
+        postings[key].append(position)
+    return {key: to_bitmap(positions) for key, positions in postings.items()}
+
+
+class PantryRanking:
+    """
+    Результат подбора: группы рецептов с одинаковыми (совпало, всего),
+    упорядоченные по доле совпадений, числу недостающих и числу
+    совпавших; внутри группы — от новых к старым. Отдельные рецепты
+    извлекаются из битовых карт только для запрошенного среза.
+    """
+
+    def __init__(self, recipe_ids, groups):
+        self.recipe_ids = recipe_ids
+        self.groups = groups
+        self.count = sum(bitmap.bit_count() for *_, bitmap in groups)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(self.count)
+        skip, need = start, max(stop - start, 0)
+        items = []
+        for coverage, missing, _, bitmap in self.groups:
+            if not need:
+                break
+            size = bitmap.bit_count()
+            if skip >= size:
+                skip -= size
+                continue
+            while bitmap and need:
+                # Старшие позиции — более новые рецепты.
+                position = bitmap.bit_length() - 1
+                bitmap ^= 1 << position
+                if skip:
+                    skip -= 1
+                else:
+                    items.append(
+                        (self.recipe_ids[position], coverage, missing)
+                    )
+                    need -= 1
+        return items
+
+
+class PantrySnapshot:
+    """
+    Инвертированный индекс ингредиент → битовая карта рецептов: бит
+    `position` означает рецепт recipe_ids[position]; позиции растут
+    вместе с id. Карты — целые Python, поэтому объединения, пересечения
+    и сложения карт идут побитово сразу по всем рецептам. Снимок не
+    меняется: правки создают новый, и читатели не видят его наполовину.
+    """
+    __slots__ = (
+        'recipe_ids', 'sizes', 'bitmaps', 'size_bitmaps', 'positions'
+    )
+
+    def __init__(self, recipe_ids, sizes, bitmaps, size_bitmaps=None):
+        self.recipe_ids = recipe_ids
+        self.sizes = sizes
+        self.bitmaps = bitmaps
+        # Рецепты по числу ингредиентов.
+        self.size_bitmaps = (
+            group_bitmaps(sizes) if size_bitmaps is None else size_bitmaps
+        )
+        self.positions = {
+            recipe_id: position
+            for position, recipe_id in enumerate(recipe_ids)
+            if recipe_id is not None
+        }
+
+    def with_recipe(self, recipe_id, ingredient_ids):
+        """Копия снимка, где у рецепта ровно ингредиенты `ingredient_ids`."""
+        ingredient_ids = set(ingredient_ids)
+        recipe_ids = list(self.recipe_ids)
+        sizes = array('H', self.sizes)
+        position = self.positions.get(recipe_id)
+        if position is None:
+            if not ingredient_ids:
+                return self
+            position = len(recipe_ids)
+            recipe_ids.append(recipe_id)
+            sizes.append(0)
+        bit = 1 << position
+        bitmaps = dict(self.bitmaps)
+        for ingredient_id, bitmap in self.bitmaps.items():
+            if bitmap & bit and ingredient_id not in ingredient_ids:
+                bitmaps[ingredient_id] = bitmap ^ bit
+        for ingredient_id in ingredient_ids:
+            bitmaps[ingredient_id] = bitmaps.get(ingredient_id, 0) | bit
+        size_bitmaps = dict(self.size_bitmaps)
+        for size in (sizes[position], len(ingredient_ids)):
+            # Размер 0 — новая или удалённая позиция, в картах её нет.
+            if size:
+                size_bitmaps[size] = size_bitmaps.get(size, 0) ^ bit
+        sizes[position] = len(ingredient_ids)
+        if not ingredient_ids:
+            # Позиция остаётся пустой до следующей полной перестройки.
+            recipe_ids[position] = None
+        return PantrySnapshot(recipe_ids, sizes, bitmaps, size_bitmaps)
+
+    def rank(self, ingredient_ids):
+        """
+        Рецепты, где есть хотя бы один ингредиент из `ingredient_ids`.
+
+        Число совпадений считается для всех рецептов сразу побитовыми
+        счётчиками: planes[k] — k-й разряд счётчика каждого рецепта,
+        каждая карта прибавляется сложением с переносом. Затем маски
+        «совпало m» пересекаются с картами размеров рецептов.
+        """
+        planes = []
+        for ingredient_id in set(ingredient_ids):
+            carry = self.bitmaps.get(ingredient_id, 0)
+            for level, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[level], carry = plane ^ carry, plane & carry
+            if carry:
+                planes.append(carry)
+        mask = (1 << len(self.recipe_ids)) - 1
+        groups = []
+        for matched in range(1, 1 << len(planes)):
+            equal = mask
+            for level, plane in enumerate(planes):
+                equal &= plane if matched >> level & 1 else ~plane
+                if not equal:
+                    break
+            if not equal:
+                continue
+            for size, recipes in self.size_bitmaps.items():
+                recipes &= equal
+                if recipes:
+                    groups.append(
+                        (matched / size, size - matched, matched, recipes)
+                    )
+        groups.sort(key=lambda group: (-group[0], group[1], -group[2]))
+        return PantryRanking(self.recipe_ids, groups)
+
+
+class PantryIndex(ProcessLocalIndex):
+    """
+    Подбор рецептов по имеющимся продуктам. Строится целиком из
+    RecipeIngredient и точечно обновляется после сохранения рецепта;
+    в остальных воркерах правки видны не позже чем через ttl.
+    """
+
+    @property
+    def ttl(self):
+        return settings.PANTRY_INDEX_TTL
+
+    def build(self):
+        rows = RecipeIngredient.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        recipe_ids = []
+        sizes = array('H')
+        postings = defaultdict(list)
+        for recipe_id, ingredient_id in rows.iterator(chunk_size=10000):
+            if not recipe_ids or recipe_ids[-1] != recipe_id:
+                recipe_ids.append(recipe_id)
+                sizes.append(0)
+            sizes[-1] += 1
+            postings[ingredient_id].append(len(recipe_ids) - 1)
+        return PantrySnapshot(recipe_ids, sizes, {
+            ingredient_id: to_bitmap(positions)
+            for ingredient_id, positions in postings.items()
+        })
+
+    def update_recipe(self, recipe_id, ingredient_ids):
+        with self._lock:
+            # Ещё не построенный индекс подхватит рецепт при построении.
+            if self._data is not None:
+                self._data = self._data.with_recipe(recipe_id, ingredient_ids)
+
+    def refresh_recipe(self, recipe_id):
+        self.update_recipe(recipe_id, RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', flat=True))
+
+    def update_on_commit(self, recipe_id, ingredient_ids=None):
+        """
+        Обновляет рецепт после фиксации транзакции; без `ingredient_ids`
+        состав рецепта перечитывается из БД.
+        """
+        if ingredient_ids is None:
+            transaction.on_commit(lambda: self.refresh_recipe(recipe_id))
+        else:
+            ingredient_ids = list(ingredient_ids)
+            transaction.on_commit(
+                lambda: self.update_recipe(recipe_id, ingredient_ids)
+            )
+
+    def rank(self, ingredient_ids):
+        """
+        Рецепты по убыванию доли имеющихся ингредиентов: срезы дают
+        [(recipe_id, доля, недостаёт), ...].
+        """
+        return self.get().rank(ingredient_ids)
+
+
+pantry_index = PantryIndex()
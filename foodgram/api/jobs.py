@@ -0,0 +1,148 @@
+import logging
+import random
+import threading
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+# SQLite блокирует таблицу целиком, и параллельные записи потоков
+# воркера в api_job падают с «database table is locked» — там они
+# выполняются по очереди.
+sqlite_lock = threading.Lock()
+
+
+def job_writes():
+    if connection.features.has_select_for_update_skip_locked:
+        return nullcontext()
+    return sqlite_lock
+
+
+def task_path(func):
+    if isinstance(func, str):
+        return func
+    return f'{func.__module__}.{func.__qualname__}'
+
+
+def enqueue(func, *args, run_at=None, max_attempts=None, **kwargs):
+    """
+    Ставит вызов func(*args, **kwargs) в очередь. Аргументы должны
+    сериализоваться в JSON. Запись создаётся в текущей транзакции,
+    поэтому воркер увидит задачу только после её коммита.
+    При BACKGROUND_TASKS_EAGER задача выполняется сразу после коммита.
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        transaction.on_commit(
+            lambda: import_string(task_path(func))(*args, **kwargs)
+        )
+        return None
+    return Job.objects.create(
+        task=task_path(func),
+        args=list(args),
+        kwargs=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def available():
+    now = timezone.now()
+    # Задачи упавшего воркера снова становятся доступны по таймауту.
+    stale = now - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(
+        Q(status=Job.QUEUED, run_at__lte=now)
+        | Q(status=Job.RUNNING, locked_at__lt=stale)
+    ).order_by('run_at', 'id')
+
+
+def lock(jobs, worker, now):
+    return jobs.update(
+        status=Job.RUNNING,
+        locked_at=now,
+        locked_by=worker,
+        attempts=F('attempts') + 1,
+    )
+
+
+def claim(worker, limit):
+    """
+    Забирает до `limit` задач для воркера `worker`.
+
+    На PostgreSQL строки блокируются SELECT ... FOR UPDATE SKIP LOCKED,
+    так что параллельные воркеры не ждут друг друга. На БД без SKIP LOCKED
+    (SQLite) каждая задача захватывается условным UPDATE: если строку
+    успел изменить другой воркер, UPDATE затронет 0 строк.
+    """
+    now = timezone.now()
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(
+                available().select_for_update(skip_locked=True).values_list(
+                    'id', flat=True
+                )[:limit]
+            )
+            lock(Job.objects.filter(pk__in=ids), worker, now)
+    else:
+        with job_writes():
+            candidates = available().values_list(
+                'id', 'status', 'locked_at'
+            )[:limit]
+            ids = [
+                pk for pk, status, locked_at in candidates
+                if lock(
+                    Job.objects.filter(
+                        pk=pk, status=status, locked_at=locked_at
+                    ),
+                    worker, now
+                )
+            ]
+    return list(Job.objects.filter(pk__in=ids, locked_by=worker))
+
+
+def retry_delay(attempts):
+    """Экспоненциальная задержка с небольшим случайным разбросом."""
+    delay = min(
+        settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1),
+        settings.JOB_RETRY_MAX_DELAY
+    )
+    return timedelta(seconds=delay * random.uniform(1, 1.1))
+
+
+def run_job(job):
+    """Выполняет задачу; успешные удаляются, упавшие откладываются."""
+    owned = Job.objects.filter(pk=job.pk, locked_by=job.locked_by)
+    try:
+        import_string(job.task)(*job.args, **job.kwargs)
+    except Exception:
+        logger.exception('Задача %s (#%s) завершилась ошибкой',
+                         job.task, job.pk)
+        error = traceback.format_exc()
+        with job_writes():
+            if job.attempts >= job.max_attempts:
+                owned.update(status=Job.FAILED, last_error=error)
+                return False
+            owned.update(
+                status=Job.QUEUED,
+                run_at=timezone.now() + retry_delay(job.attempts),
+                locked_at=None,
+                locked_by='',
+                last_error=error,
+            )
+        return False
+    else:
+        with job_writes():
+            owned.delete()
+        return True
+    finally:
+        # Соединения потоков воркера иначе живут до завершения процесса.
+        close_old_connections()
@@ -0,0 +1,319 @@
+import csv
+import json
+import random
+import statistics
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.counters import recount
+from api.feed import rebuild_feeds
+from api.indexes import ingredient_index, pantry_index
+from api.models import (
+    CartItem, Favorite, Follow, Ingredient, Recipe, RecipeIngredient
+)
+from api.shopping_cart import rebuild_shopping_lists
+
+User = get_user_model()
+
+DEFAULT_INGREDIENTS = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+BATCH_SIZE = 1000
+
+
+def zipf_weights(count, skew):
+    """Вес i-го элемента ∝ 1 / (i + 1)^skew: немногие популярны."""
+    return [1 / (rank + 1) ** skew for rank in range(count)]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный замер API на синтетических данных: создаёт тестовую '
+        'БД, заполняет её и выводит p50/p95 и число запросов в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument(
+            '--iterations', type=int, default=50,
+            help='Замеров на каждый сценарий'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Прогревочных запросов на сценарий (не учитываются)'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности'
+        )
+        parser.add_argument(
+            '--ingredients', type=Path, default=DEFAULT_INGREDIENTS,
+            help='CSV со списком ингредиентов'
+        )
+        parser.add_argument(
+            '--output', type=Path,
+            help='Куда записать результат (по умолчанию stdout)'
+        )
+        parser.add_argument(
+            '--baseline', type=Path,
+            help='Результат прошлого запуска для сравнения'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p95 относительно baseline (0.2 = 20%%)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['ingredients'].exists():
+            raise CommandError(
+                f'Файл не найден: {options["ingredients"]}'
+            )
+        if min(options['users'], options['recipes']) < 2:
+            raise CommandError('Нужно хотя бы 2 пользователя и 2 рецепта')
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        # Данные создаются во временной тестовой БД, рабочая не трогается.
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            self.seed()
+            results = self.run_scenarios()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            'meta': {
+                'vendor': connection.vendor,
+                **{
+                    key: options[key] for key in (
+                        'users', 'recipes', 'iterations', 'seed', 'skew'
+                    )
+                },
+            },
+            'scenarios': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            options['output'].write_text(output + '\n', encoding='utf-8')
+        else:
+            self.stdout.write(output)
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    def seed(self):
+        options, rng = self.options, self.rng
+        with options['ingredients'].open(encoding='utf-8') as stream:
+            ingredients = Ingredient.objects.bulk_create(
+                (Ingredient(name=row[0], unit=row[1])
+                 for row in csv.reader(stream) if len(row) > 1),
+                batch_size=BATCH_SIZE
+            )
+        users = User.objects.bulk_create(
+            (
+                User(
+                    email=f'bench{number}@example.com',
+                    username=f'bench{number}',
+                    password='!',
+                )
+                for number in range(options['users'])
+            ),
+            batch_size=BATCH_SIZE
+        )
+        user_weights = zipf_weights(len(users), options['skew'])
+        authors = rng.choices(users, user_weights, k=options['recipes'])
+        recipes = Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author=author,
+                    title=f'Рецепт {number}',
+                    text='Описание рецепта',
+                    cooking_time=rng.randint(5, 180),
+                    image='recipes/images/bench.png',
+                )
+                for number, author in enumerate(authors)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        ingredient_weights = zipf_weights(len(ingredients), options['skew'])
+        RecipeIngredient.objects.bulk_create(
+            (
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient,
+                    amount=rng.randint(1, 500)
+                )
+                for recipe in recipes
+                for ingredient in self.sample(
+                    ingredients, ingredient_weights, rng.randint(3, 12)
+                )
+            ),
+            batch_size=BATCH_SIZE
+        )
+        recipe_weights = zipf_weights(len(recipes), options['skew'])
+        for model in (Favorite, CartItem):
+            model.objects.bulk_create(
+                (
+                    model(user=user, recipe=recipe)
+                    for user in users
+                    for recipe in self.sample(
+                        recipes, recipe_weights, rng.randint(0, 20)
+                    )
+                ),
+                batch_size=BATCH_SIZE
+            )
+        Follow.objects.bulk_create(
+            (
+                Follow(user=user, author=author)
+                for user in users
+                for author in self.sample(
+                    users, user_weights, rng.randint(0, 15)
+                )
+                if author != user
+            ),
+            batch_size=BATCH_SIZE
+        )
+        # bulk_create не вызывает сигналы — счётчики и кэши приводим сами.
+        recount()
+        rebuild_feeds()
+        rebuild_shopping_lists()
+        cache.clear()
+        ingredient_index.invalidate()
+        pantry_index.invalidate()
+        self.users, self.recipes = users, recipes
+        self.recipe_weights = recipe_weights
+        self.ingredient_names = [ingredient.name for ingredient in ingredients]
+        self.ingredient_ids = [ingredient.pk for ingredient in ingredients]
+        self.ingredient_weights = ingredient_weights
+
+    def sample(self, population, weights, count):
+        """Различные элементы с учётом весов (повторы отбрасываются)."""
+        return set(self.rng.choices(population, weights, k=count))
+
+    def scenarios(self):
+        rng = self.rng
+        # Самый активный подписчик — худший случай для подписок и корзины.
+        reader_id = Follow.objects.values('user').annotate(
+            follows=Count('id')
+        ).order_by('-follows', 'user').values_list('user', flat=True).first()
+        token = Token.objects.create(
+            user_id=reader_id or self.users[0].pk
+        ).key
+        anonymous = Client(HTTP_HOST='localhost')
+        client = Client(
+            HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Token {token}'
+        )
+        pages = max(len(self.recipes) // 6, 1)
+
+        def recipe():
+            return rng.choices(self.recipes, self.recipe_weights)[0]
+
+        def toggle(path):
+            def request():
+                url = path.format(pk=recipe().pk)
+                client.post(url)
+                return client.delete(url)
+            return request
+
+        return {
+            'recipes_list_anonymous': lambda: anonymous.get(
+                '/api/recipes/', {'page': rng.randint(1, pages)}
+            ),
+            'recipes_list': lambda: client.get(
+                '/api/recipes/', {'page': rng.randint(1, pages)}
+            ),
+            'recipes_list_cursor': lambda: client.get(
+                '/api/recipes/', {'cursor': ''}
+            ),
+            'recipes_search': lambda: client.get(
+                '/api/recipes/',
+                {'search': rng.choice(self.ingredient_names).split()[0]}
+            ),
+            'recipes_pantry': lambda: client.get(
+                '/api/recipes/pantry/', {'ingredients': ','.join(
+                    str(pk) for pk in self.sample(
+                        self.ingredient_ids, self.ingredient_weights, 10
+                    )
+                )}
+            ),
+            'recipe_detail': lambda: client.get(
+                f'/api/recipes/{recipe().pk}/'
+            ),
+            'ingredients_search': lambda: client.get(
+                '/api/ingredients/',
+                {'name': rng.choice(self.ingredient_names)[:2]}
+            ),
+            'subscriptions': lambda: client.get(
+                '/api/users/subscriptions/', {'limit': 6}
+            ),
+            'subscriptions_feed': lambda: client.get(
+                '/api/users/subscriptions/feed/', {'limit': 6}
+            ),
+            'favorite_toggle': toggle('/api/recipes/{pk}/favorite/'),
+            'shopping_cart_toggle': toggle('/api/recipes/{pk}/shopping_cart/'),
+            'download_shopping_cart': lambda: b''.join(client.get(
+                '/api/recipes/download_shopping_cart/'
+            ).streaming_content),
+        }
+
+    def run_scenarios(self):
+        results = {}
+        for name, request in self.scenarios().items():
+            for _ in range(self.options['warmup']):
+                request()
+            timings, queries = [], []
+            for _ in range(self.options['iterations']):
+                with CaptureQueriesContext(connection) as ctx:
+                    started = perf_counter()
+                    request()
+                    timings.append((perf_counter() - started) * 1000)
+                queries.append(len(ctx.captured_queries))
+            results[name] = {
+                'p50_ms': round(statistics.median(timings), 2),
+                'p95_ms': round(percentile(timings, 0.95), 2),
+                'mean_ms': round(statistics.fmean(timings), 2),
+                'queries': max(queries),
+            }
+            if self.options['verbosity'] >= 2:
+                self.stderr.write(f'{name}: {results[name]}')
+        return results
+
+    def compare(self, results, path):
+        baseline = json.loads(path.read_text(encoding='utf-8'))['scenarios']
+        threshold = 1 + self.options['threshold']
+        regressions = []
+        for name, current in results.items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            if current['queries'] > previous['queries']:
+                regressions.append(
+                    f'{name}: запросов {previous["queries"]} → '
+                    f'{current["queries"]}'
+                )
+            if current['p95_ms'] > previous['p95_ms'] * threshold:
+                regressions.append(
+                    f'{name}: p95 {previous["p95_ms"]} → '
+                    f'{current["p95_ms"]} мс'
+                )
+        if regressions:
+            raise CommandError(
+                'Регрессия относительно baseline:\n' + '\n'.join(regressions)
+            )
+        self.stderr.write(self.style.SUCCESS(
+            'Регрессий относительно baseline нет.'
+        ))
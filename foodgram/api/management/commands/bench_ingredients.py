@@ -0,0 +1,70 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.indexes import ingredient_index
+from api.models import Ingredient
+
+
+def measure(func, prefixes, repeat):
+    timings = []
+    for _ in range(repeat):
+        for prefix in prefixes:
+            started = time.perf_counter()
+            func(prefix)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'mean': statistics.fmean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def db_lookup(prefix):
+    # Прежний путь: SearchFilter('^name') + пагинация с COUNT.
+    queryset = Ingredient.objects.filter(
+        name__istartswith=prefix
+    ).order_by('name')
+    queryset.count()
+    return list(queryset)
+
+
+class Command(BaseCommand):
+    help = 'Сравнение поиска ингредиентов по префиксу: БД и индекс в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookups', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        keys, _, _ = ingredient_index.get()
+        if not keys:
+            raise CommandError(
+                'Таблица ингредиентов пуста — сначала выполните '
+                'import_ingredients.'
+            )
+        rng = random.Random(options['seed'])
+        # Префиксы длиной 1–3 символа, как при наборе в автодополнении.
+        prefixes = [
+            name[:rng.randint(1, 3)]
+            for name in rng.choices(keys, k=options['lookups'])
+        ]
+        results = {
+            'db': measure(db_lookup, prefixes, options['repeat']),
+            'index': measure(
+                ingredient_index.search, prefixes, options['repeat']
+            ),
+        }
+        for name, stats in results.items():
+            self.stdout.write(
+                f'{name:>5}: mean {stats["mean"]:.3f} мс, '
+                f'p50 {stats["p50"]:.3f} мс, p95 {stats["p95"]:.3f} мс'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение по медиане: '
+            f'{results["db"]["p50"] / results["index"]["p50"]:.1f}x'
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from api.images import generate_variants
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Построение уменьшенных копий изображений рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересобрать копии и для рецептов, у которых они уже есть'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        built = 0
+        for recipe_id, image in recipes.values_list('id', 'image').iterator():
+            try:
+                generate_variants(recipe_id, image)
+            except OSError as error:
+                self.stderr.write(f'Рецепт {recipe_id}: {error}')
+                continue
+            built += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Обработано рецептов: {built}.'
+        ))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.shopping_cart import (
+    rebuild_shopping_lists, shopping_list_discrepancies
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверка материализованных списков покупок с полным пересчётом '
+        'по корзинам'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Пересобрать списки пользователей с расхождениями'
+        )
+
+    def handle(self, *args, **options):
+        discrepancies = list(shopping_list_discrepancies())
+        for user_id, ingredient_id, stored, expected in discrepancies:
+            self.stdout.write(
+                f'пользователь {user_id}, ингредиент {ingredient_id}: '
+                f'сохранено {stored}, по корзине {expected}'
+            )
+        if not discrepancies:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет.'))
+            return
+        if not options['fix']:
+            raise CommandError(
+                f'Расхождений: {len(discrepancies)}. '
+                'Исправить: check_shopping_lists --fix'
+            )
+        users = {user_id for user_id, *_rest in discrepancies}
+        rebuild_shopping_lists(users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобраны списки пользователей: {len(users)}.'
+        ))
@@ -1,51 +1,211 @@
+import csv
 import json
+from itertools import islice
 from pathlib import Path
 
 from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import invalidate_catalog
+from api.indexes import ingredient_index
 from api.models import Ingredient
 
+FORMATS = ('csv', 'json', 'ndjson')
+READ_CHUNK_SIZE = 1 << 16
+
+
+def iter_csv(stream):
+    for row in csv.reader(stream):
+        if not row:
+            continue
+        yield {
+            'name': row[0],
+            'measurement_unit': row[1] if len(row) > 1 else None,
+        }
+
+
+def iter_ndjson(stream):
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as error:
+            raise CommandError(f'Строка {number}: некорректный JSON: {error}')
+
+
+def iter_json_array(stream):
+    """Потоково разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    opened = False
+    while True:
+        buffer = buffer.lstrip()
+        if opened and buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if buffer and not opened:
+            if buffer[0] != '[':
+                raise CommandError('Ожидается JSON-массив ингредиентов')
+            buffer = buffer[1:]
+            opened = True
+            continue
+        if opened and buffer.startswith(']'):
+            return
+        if buffer:
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                pass
+            else:
+                buffer = buffer[end:]
+                yield item
+                continue
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            raise CommandError('Неожиданный конец JSON-файла')
+        buffer += chunk
+
+
+def iter_json(stream):
+    # .json может содержать как массив, так и NDJSON — смотрим на
+    # первый значащий символ.
+    head = stream.read(READ_CHUNK_SIZE)
+    stripped = head.lstrip()
+    stream.seek(0)
+    if stripped.startswith('['):
+        return iter_json_array(stream)
+    return iter_ndjson(stream)
+
+
+READERS = {
+    'csv': iter_csv,
+    'json': iter_json,
+    'ndjson': iter_ndjson,
+}
+
+
+def detect_format(path):
+    suffix = path.suffix.lower()
+    if suffix in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    if suffix == '.json':
+        return 'json'
+    if suffix == '.csv':
+        return 'csv'
+    raise CommandError(
+        f'Не удалось определить формат файла {path}, укажите --format'
+    )
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
 
 class Command(BaseCommand):
-    help = 'Импорт ингредиентов из JSON-файла'
+    help = 'Импорт ингредиентов из CSV, JSON или NDJSON'
 
     def add_arguments(self, parser):
         parser.add_argument(
-            'json_path',
+            'path',
             type=str,
-            help='Путь к JSON-файлу со списком ингредиентов'
+            help='Путь к файлу со списком ингредиентов'
+        )
+        parser.add_argument(
+            '--format',
+            choices=FORMATS,
+            help='Формат файла; по умолчанию определяется по расширению'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Количество записей в одном INSERT'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только проверить файл, ничего не записывая в БД'
         )
 
-    def handle(self, *args, **options):
-        path = Path(options['json_path'])
-        if not path.exists():
-            raise CommandError(f'Файл не найден: {path}')
-
-        self.stdout.write(f'Читаю файл {path}...')
-        data = json.loads(path.read_text(encoding='utf-8'))
-
-        created = 0
-        skipped = 0
-        for item in data:
-            name = item.get('name')
-            unit = item.get('measurement_unit')
-            if not name or not unit:
-                self.stderr.write(f'Пропускаю некорректную запись: {item}')
-                skipped += 1
+    def clean(self, items):
+        for item in items:
+            name = item.get('name') if isinstance(item, dict) else None
+            unit = (
+                item.get('measurement_unit') or item.get('unit')
+                if isinstance(item, dict) else None
+            )
+            if not name or not unit or not name.strip() or not unit.strip():
+                self.skipped += 1
+                if self.verbosity >= 2:
+                    self.stderr.write(
+                        f'Пропускаю некорректную запись: {item}'
+                    )
                 continue
+            yield name.strip(), unit.strip()
 
-            obj, was_created = Ingredient.objects.get_or_create(
-                name=name,
-                defaults={'unit': unit}
+    def write_batch(self, batch):
+        # В одном INSERT ... ON CONFLICT имя должно встречаться один раз.
+        ingredients = dict(batch)
+        self.skipped += len(batch) - len(ingredients)
+        if not self.dry_run:
+            # Неизменённые строки не трогаем: иначе updated_at сдвинет
+            # Last-Modified и ETag рецептов и справочника у всех клиентов.
+            existing = Ingredient.objects.in_bulk(
+                list(ingredients), field_name='name'
             )
-            if was_created:
-                created += 1
-                self.stdout.write(
-                    self.style.SUCCESS(f'Создан ингредиент: {obj}')
+            changed = [
+                Ingredient(name=name, unit=unit)
+                for name, unit in ingredients.items()
+                if name not in existing or existing[name].unit != unit
+            ]
+            if changed:
+                Ingredient.objects.bulk_create(
+                    changed,
+                    update_conflicts=True,
+                    unique_fields=['name'],
+                    update_fields=['unit', 'updated_at'],
                 )
-            else:
-                skipped += 1
+            self.written += len(changed)
+        self.processed += len(ingredients)
+        if self.verbosity >= 2:
+            self.stdout.write(f'Обработано записей: {self.processed}')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        file_format = options['format'] or detect_format(path)
+        self.verbosity = options['verbosity']
+        self.dry_run = options['dry_run']
+        self.processed = 0
+        self.skipped = 0
+        self.written = 0
+
+        self.stdout.write(f'Читаю файл {path} ({file_format})...')
+        before = Ingredient.objects.count()
+        with path.open(encoding='utf-8-sig', newline='') as stream:
+            records = self.clean(READERS[file_format](stream))
+            with transaction.atomic():
+                for batch in batched(records, options['batch_size']):
+                    self.write_batch(batch)
+        if self.written:
+            ingredient_index.invalidate()
+            invalidate_catalog()
 
+        if self.dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f'Проверка завершена. Корректных записей: {self.processed}, '
+                f'пропущено (дубликаты или ошибки): {self.skipped}.'
+            ))
+            return
+        created = Ingredient.objects.count() - before
         self.stdout.write(self.style.SUCCESS(
-            f'Готово. Создано: {created}, пропущено \
-            (уже было или ошибки): {skipped}.'
+            f'Готово. Создано: {created}, обновлено или без изменений: '
+            f'{self.processed - created}, пропущено (дубликаты или '
+            f'ошибки): {self.skipped}.'
         ))
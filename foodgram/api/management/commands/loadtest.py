@@ -0,0 +1,98 @@
+import json
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from .bench import percentile
+
+DEFAULT_PATHS = (
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/recipes/?limit=20',
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузка на запущенный сервер с разным числом одновременных '
+        'запросов: сравнение WSGI (gunicorn) и ASGI (uvicorn) по '
+        'пропускной способности и p50/p95'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'url', help='Адрес сервера, например http://localhost:8000'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 8, 32, 64],
+            help='Уровни параллельности'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Запросов на каждый уровень'
+        )
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Путь для запросов (можно несколько, по кругу)'
+        )
+        parser.add_argument(
+            '--token', help='Токен для заголовка Authorization'
+        )
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        self.options = options
+        paths = options['paths'] or DEFAULT_PATHS
+        self.urls = [urljoin(options['url'], path) for path in paths]
+        self.headers = {}
+        if options['token']:
+            self.headers['Authorization'] = f'Token {options["token"]}'
+        try:
+            self.fetch(self.urls[0])
+        except URLError as error:
+            raise CommandError(f'Сервер недоступен: {error.reason}')
+
+        results = {}
+        for level in options['concurrency']:
+            results[level] = self.run(level)
+            if options['verbosity'] >= 2:
+                self.stderr.write(f'{level}: {results[level]}')
+        self.stdout.write(json.dumps(
+            {'url': options['url'], 'paths': list(paths),
+             'concurrency': results},
+            ensure_ascii=False, indent=2
+        ))
+
+    def fetch(self, url):
+        request = Request(url, headers=self.headers)
+        started = perf_counter()
+        try:
+            with urlopen(request, timeout=self.options['timeout']) as response:
+                response.read()
+                status = response.status
+        except HTTPError as error:
+            status = error.code
+        return (perf_counter() - started) * 1000, status
+
+    def run(self, level):
+        total = self.options['requests']
+        with ThreadPoolExecutor(max_workers=level) as pool:
+            started = perf_counter()
+            responses = list(pool.map(
+                self.fetch,
+                (self.urls[number % len(self.urls)]
+                 for number in range(total))
+            ))
+            elapsed = perf_counter() - started
+        timings = [timing for timing, _ in responses]
+        return {
+            'rps': round(total / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'errors': sum(status >= 400 for _, status in responses),
+        }
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.counters import recount
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчёт денормализованных счётчиков избранного, покупок, '
+        'рецептов и подписчиков'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            updated = recount()
+        for name, rows in updated.items():
+            self.stdout.write(f'{name}: пересчитано строк — {rows}')
+        self.stdout.write(self.style.SUCCESS('Готово.'))
@@ -0,0 +1,101 @@
+import logging
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, close_old_connections
+
+from api.jobs import claim, run_job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Выполнение фоновых задач из очереди (таблица Job)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Число потоков, выполняющих задачи'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза (сек) между опросами пустой очереди'
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Завершиться, когда очередь опустеет'
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency должен быть положительным')
+        self.stopping = threading.Event()
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, lambda *args: self.stopping.set())
+        worker = f'{socket.gethostname()}:{os.getpid()}'[-64:]
+        self.succeeded = self.failed = 0
+
+        self.stdout.write(
+            f'Воркер {worker} запущен, потоков: {concurrency}.'
+        )
+        with ThreadPoolExecutor(
+            concurrency, thread_name_prefix='run-worker'
+        ) as pool:
+            running = set()
+            try:
+                while not self.stopping.is_set():
+                    running = self.collect(running)
+                    free = concurrency - len(running)
+                    close_old_connections()
+                    try:
+                        jobs = claim(worker, free) if free else []
+                    except DatabaseError:
+                        # Блокировка или обрыв соединения не должны
+                        # останавливать воркер: соединение переоткроется.
+                        logger.exception('Не удалось забрать задачи')
+                        close_old_connections()
+                        self.stopping.wait(options['poll_interval'])
+                        continue
+                    for job in jobs:
+                        running.add(pool.submit(run_job, job))
+                    if jobs:
+                        continue
+                    if not running:
+                        if options['burst']:
+                            break
+                        self.stopping.wait(options['poll_interval'])
+                    else:
+                        wait(
+                            running, timeout=options['poll_interval'],
+                            return_when=FIRST_COMPLETED
+                        )
+            except KeyboardInterrupt:
+                self.stdout.write('Останавливаюсь, дожидаюсь задач...')
+            wait(running)
+            self.collect(running)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Выполнено задач: {self.succeeded}, '
+            f'с ошибкой: {self.failed}.'
+        ))
+
+    def collect(self, running):
+        """Подсчитывает завершённые задачи, возвращает ещё идущие."""
+        pending = set()
+        for future in running:
+            if not future.done():
+                pending.add(future)
+            elif future.result():
+                self.succeeded += 1
+            else:
+                self.failed += 1
+        return pending
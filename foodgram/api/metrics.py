@@ -0,0 +1,187 @@
+import hmac
+import os
+import pickle
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+# Границы корзин гистограммы длительности запроса (сек).
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def render(self, name, labels):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.total}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class RouteStats:
+    __slots__ = ('duration', 'queries', 'sql_seconds', 'statuses')
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.sql_seconds = 0.0
+        self.statuses = {}
+
+    def merge(self, other):
+        self.duration.merge(other.duration)
+        self.queries.merge(other.queries)
+        self.sql_seconds += other.sql_seconds
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+
+
+class MetricsRegistry:
+    """
+    Счётчики запросов в памяти процесса: на каждый запрос — одно
+    обновление под блокировкой, без обращений к БД или кэшу.
+
+    Запрос метрик попадает к случайному воркеру gunicorn, поэтому
+    с METRICS_DIR каждый процесс не реже раза в METRICS_FLUSH_INTERVAL
+    сохраняет свои счётчики в файл <pid>.pickle, а /api/_metrics
+    складывает файлы всех воркеров. Без METRICS_DIR отдаются счётчики
+    одного процесса — это годится только для разработки.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed = 0.0
+
+    def observe(self, route, method, status, timings):
+        with self._lock:
+            stats = self._routes.get((route, method))
+            if stats is None:
+                stats = self._routes[(route, method)] = RouteStats()
+            stats.duration.observe(timings.total)
+            stats.queries.observe(timings.queries)
+            stats.sql_seconds += timings.sql
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+        if (
+            settings.METRICS_DIR
+            and time.monotonic() - self._flushed
+            >= settings.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+
+    def flush(self):
+        """Сохраняет счётчики процесса в METRICS_DIR."""
+        # Имя файла — по pid на момент записи: после fork у воркеров
+        # gunicorn общий реестр, унаследованный от мастера.
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                data = pickle.dumps(self._routes)
+                self._flushed = time.monotonic()
+            path = Path(settings.METRICS_DIR) / f'{os.getpid()}.pickle'
+            temporary = path.with_suffix('.tmp')
+            temporary.write_bytes(data)
+            os.replace(temporary, path)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """Счётчики всех воркеров, по маршруту и методу."""
+        if not settings.METRICS_DIR:
+            with self._lock:
+                return pickle.loads(pickle.dumps(self._routes))
+        self.flush()
+        routes = {}
+        for path in Path(settings.METRICS_DIR).glob('*.pickle'):
+            try:
+                data = pickle.loads(path.read_bytes())
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            for key, stats in data.items():
+                routes.setdefault(key, RouteStats()).merge(stats)
+        return routes
+
+    def render(self):
+        lines = [
+            '# HELP foodgram_requests_total Число обработанных запросов.',
+            '# TYPE foodgram_requests_total counter',
+        ]
+        duration = [
+            '# HELP foodgram_request_duration_seconds Время ответа.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        queries = [
+            '# HELP foodgram_request_queries SQL-запросов на один запрос.',
+            '# TYPE foodgram_request_queries histogram',
+        ]
+        sql = [
+            '# HELP foodgram_request_sql_seconds_total Время в SQL.',
+            '# TYPE foodgram_request_sql_seconds_total counter',
+        ]
+        for (route, method), stats in sorted(self.collect().items()):
+            labels = f'route="{route}",method="{method}"'
+            for status, count in sorted(stats.statuses.items()):
+                lines.append(
+                    f'foodgram_requests_total{{{labels},'
+                    f'status="{status}"}} {count}'
+                )
+            duration.extend(stats.duration.render(
+                'foodgram_request_duration_seconds', labels
+            ))
+            queries.extend(stats.queries.render(
+                'foodgram_request_queries', labels
+            ))
+            sql.append(
+                f'foodgram_request_sql_seconds_total{{{labels}}} '
+                f'{stats.sql_seconds}'
+            )
+        return '\n'.join((*lines, *duration, *queries, *sql)) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def metrics_view(request):
+    """
+    /api/_metrics — метрики в текстовом формате Prometheus.
+    Если задан METRICS_TOKEN, нужен заголовок Authorization: Bearer <токен>.
+    """
+    token = settings.METRICS_TOKEN
+    if token and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {token}'
+    ):
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
@@ -0,0 +1,200 @@
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject, empty
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import registry
+from .routers import pin_to_primary
+
+KNOWN_METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    __slots__ = (
+        'queries', 'sql', 'started', 'view_started', 'view', 'render', 'total'
+    )
+
+    def __init__(self):
+        self.queries = 0
+        self.sql = 0.0
+        self.started = perf_counter()
+        self.view_started = None
+        self.view = 0.0
+        self.render = 0.0
+        self.total = 0.0
+
+    def server_timing(self):
+        app = max(self.view - self.sql, 0)
+        return ', '.join((
+            f'db;dur={self.sql * 1000:.1f};desc="{self.queries} queries"',
+            f'app;dur={app * 1000:.1f}',
+            f'render;dur={self.render * 1000:.1f}',
+            f'total;dur={self.total * 1000:.1f}',
+        ))
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Обёртка execute_wrapper, постоянно висящая на соединениях: время
+    и число запросов пишутся в замер текущего запроса. Замер берётся
+    из contextvar, поэтому учитываются и запросы асинхронного ORM,
+    выполняемые в потоках sync_to_async.
+    """
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql += perf_counter() - started
+        timings.queries += 1
+
+
+def install_query_recorder(connection, **kwargs):
+    # Обработчик connection_created: при переподключении список обёрток
+    # сохраняется, поэтому повторно не добавляем.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def resolved_user(request):
+    """
+    Пользователь запроса, если он уже известен. Ленивый request.user
+    не вычисляем: в асинхронном контексте это был бы запрос к БД.
+    """
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user
+
+
+class InstrumentationMiddleware:
+    """
+    Замеряет каждый запрос: число и время SQL-запросов, время
+    представления (вместе с сериализацией) и рендеринга ответа.
+    Итог пишется в общий реестр метрик, а сотрудникам — ещё и
+    в заголовок Server-Timing.
+
+    Время рендеринга — это промежуток между process_template_response
+    (представление вернуло ответ DRF) и возвратом из get_response.
+    Работает и под WSGI, и под ASGI без переключения в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+            # Синхронные хуки Django под ASGI запускал бы в потоке.
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = request.timings = RequestTimings()
+        token = _timings.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = request.timings = RequestTimings()
+        token = _timings.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        finished = perf_counter()
+        timings.total = finished - timings.started
+        if timings.view_started is not None:
+            if timings.view:
+                timings.render = finished - timings.view_started - timings.view
+            else:
+                timings.view = finished - timings.view_started
+        match = request.resolver_match
+        registry.observe(
+            match.view_name if match else 'unmatched',
+            request.method if request.method in KNOWN_METHODS else 'OTHER',
+            response.status_code, timings
+        )
+        user = resolved_user(request)
+        if settings.DEBUG or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = timings.server_timing()
+        return response
+
+    def start_view(self, request):
+        request.timings.view_started = perf_counter()
+
+    def end_view(self, request, response):
+        timings = request.timings
+        timings.view = perf_counter() - timings.view_started
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        self.start_view(request)
+
+    def process_template_response(self, request, response):
+        return self.end_view(request, response)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        self.start_view(request)
+
+    async def aprocess_template_response(self, request, response):
+        return self.end_view(request, response)
+
+
+class PrimaryPinMiddleware:
+    """
+    После успешного изменяющего запроса закрепляет пользователя за
+    основной БД на REPLICA_PIN_SECONDS, пока реплики догоняют запись.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def writer(self, request, response):
+        user = resolved_user(request)
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+            and user is not None
+            and user.is_authenticated
+        ):
+            return user
+        return None
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        user = self.writer(request, response)
+        if user is not None:
+            pin_to_primary(response, user)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        user = self.writer(request, response)
+        if user is not None:
+            pin_to_primary(response, user)
+        return response
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.1 on 2026-10-18 10:12
+
+import api.models
+from django.db import migrations, models
+
+
+def fill_short_codes(apps, schema_editor):
+    Recipe = apps.get_model("api", "Recipe")
+    recipes = list(Recipe.objects.filter(short_code__isnull=True).only("id"))
+    for recipe in recipes:
+        recipe.short_code = api.models.generate_short_code()
+    Recipe.objects.bulk_update(recipes, ["short_code"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0002_alter_recipeingredient_recipe"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="short_code",
+            field=models.CharField(
+                editable=False,
+                max_length=11,
+                null=True,
+                verbose_name="Код короткой ссылки",
+            ),
+        ),
+        migrations.RunPython(fill_short_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="recipe",
+            name="short_code",
+            field=models.CharField(
+                default=api.models.generate_short_code,
+                editable=False,
+                max_length=11,
+                unique=True,
+                verbose_name="Код короткой ссылки",
+            ),
+        ),
+    ]
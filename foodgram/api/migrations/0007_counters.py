@@ -0,0 +1,71 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def actual_count(source, field):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model("api", "Recipe")
+    CustomUser = apps.get_model("api", "CustomUser")
+    Favorite = apps.get_model("api", "Favorite")
+    CartItem = apps.get_model("api", "CartItem")
+    Follow = apps.get_model("api", "Follow")
+    Recipe.objects.update(
+        favorites_count=actual_count(Favorite, "recipe"),
+        cart_count=actual_count(CartItem, "recipe"),
+    )
+    CustomUser.objects.update(
+        recipes_count=actual_count(Recipe, "author"),
+        followers_count=actual_count(Follow, "author"),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0006_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="followers_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Подписчиков"
+            ),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="recipes_count",
+            field=models.PositiveIntegerField(default=0, verbose_name="Рецептов"),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="cart_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Добавлено в список покупок"
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="favorites_count",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Добавлено в избранное"
+            ),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
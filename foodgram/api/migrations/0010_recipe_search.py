@@ -0,0 +1,227 @@
+# Generated by Django 5.2.1 on 2026-10-18 18:40
+
+from django.db import migrations
+
+# PostgreSQL: столбец tsvector (вес A — название, B — ингредиенты,
+# C — описание) под GIN-индексом. Его пересчитывает триггер рецепта;
+# изменения ингредиентов рецепта и переименования ингредиентов
+# «трогают» название рецепта, чтобы сработал тот же триггер.
+POSTGRESQL_FORWARD = [
+    """
+    ALTER TABLE api_recipe ADD COLUMN search_vector tsvector
+    """,
+    """
+    CREATE FUNCTION api_recipe_search_vector() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', NEW.title), 'A') ||
+            setweight(to_tsvector('russian', coalesce((
+                SELECT string_agg(ingredient.name, ' ')
+                FROM api_recipeingredient AS item
+                JOIN api_ingredient AS ingredient
+                    ON ingredient.id = item.ingredient_id
+                WHERE item.recipe_id = NEW.id
+            ), '')), 'B') ||
+            setweight(to_tsvector('russian', NEW.text), 'C');
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER api_recipe_search_vector
+    BEFORE INSERT OR UPDATE OF title, text ON api_recipe
+    FOR EACH ROW EXECUTE FUNCTION api_recipe_search_vector()
+    """,
+    """
+    CREATE FUNCTION api_recipeingredient_search_vector()
+    RETURNS trigger AS $$
+    BEGIN
+        UPDATE api_recipe SET title = title
+        WHERE id IN (SELECT recipe_id FROM changed);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER api_recipeingredient_search_insert
+    AFTER INSERT ON api_recipeingredient
+    REFERENCING NEW TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION api_recipeingredient_search_vector()
+    """,
+    """
+    CREATE TRIGGER api_recipeingredient_search_delete
+    AFTER DELETE ON api_recipeingredient
+    REFERENCING OLD TABLE AS changed
+    FOR EACH STATEMENT EXECUTE FUNCTION api_recipeingredient_search_vector()
+    """,
+    # Таблицы переходов недоступны триггерам со списком столбцов.
+    """
+    CREATE FUNCTION api_recipeingredient_search_moved()
+    RETURNS trigger AS $$
+    BEGIN
+        UPDATE api_recipe SET title = title
+        WHERE id IN (OLD.recipe_id, NEW.recipe_id);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER api_recipeingredient_search_update
+    AFTER UPDATE OF recipe_id, ingredient_id ON api_recipeingredient
+    FOR EACH ROW WHEN (
+        OLD.recipe_id IS DISTINCT FROM NEW.recipe_id
+        OR OLD.ingredient_id IS DISTINCT FROM NEW.ingredient_id
+    )
+    EXECUTE FUNCTION api_recipeingredient_search_moved()
+    """,
+    """
+    CREATE FUNCTION api_ingredient_search_vector() RETURNS trigger AS $$
+    BEGIN
+        UPDATE api_recipe SET title = title
+        WHERE id IN (
+            SELECT recipe_id FROM api_recipeingredient
+            WHERE ingredient_id = NEW.id
+        );
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER api_ingredient_search_vector
+    AFTER UPDATE OF name ON api_ingredient
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION api_ingredient_search_vector()
+    """,
+    """
+    UPDATE api_recipe SET title = title
+    """,
+    """
+    CREATE INDEX recipe_search_vector_idx
+    ON api_recipe USING gin (search_vector)
+    """,
+]
+
+POSTGRESQL_BACKWARD = [
+    "DROP TRIGGER api_ingredient_search_vector ON api_ingredient",
+    "DROP FUNCTION api_ingredient_search_vector()",
+    "DROP TRIGGER api_recipeingredient_search_update ON api_recipeingredient",
+    "DROP FUNCTION api_recipeingredient_search_moved()",
+    "DROP TRIGGER api_recipeingredient_search_delete ON api_recipeingredient",
+    "DROP TRIGGER api_recipeingredient_search_insert ON api_recipeingredient",
+    "DROP FUNCTION api_recipeingredient_search_vector()",
+    "DROP TRIGGER api_recipe_search_vector ON api_recipe",
+    "DROP FUNCTION api_recipe_search_vector()",
+    "ALTER TABLE api_recipe DROP COLUMN search_vector",
+]
+
+# SQLite: таблица FTS5 с rowid = id рецепта, которую ведут триггеры.
+SQLITE_INGREDIENT_NAMES = """
+    SELECT group_concat(ingredient.name, ' ')
+    FROM api_recipeingredient AS item
+    JOIN api_ingredient AS ingredient ON ingredient.id = item.ingredient_id
+    WHERE item.recipe_id = {recipe_id}
+"""
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE api_recipe_fts USING fts5(
+        title, ingredients, text, tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER api_recipe_fts_insert AFTER INSERT ON api_recipe BEGIN
+        INSERT INTO api_recipe_fts (rowid, title, ingredients, text)
+        VALUES (NEW.id, NEW.title, '', NEW.text);
+    END
+    """,
+    """
+    CREATE TRIGGER api_recipe_fts_update
+    AFTER UPDATE OF title, text ON api_recipe BEGIN
+        UPDATE api_recipe_fts SET title = NEW.title, text = NEW.text
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_recipe_fts_delete AFTER DELETE ON api_recipe BEGIN
+        DELETE FROM api_recipe_fts WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_recipeingredient_fts_insert
+    AFTER INSERT ON api_recipeingredient BEGIN
+        UPDATE api_recipe_fts SET ingredients = ({
+            SQLITE_INGREDIENT_NAMES.format(recipe_id="NEW.recipe_id")
+        }) WHERE rowid = NEW.recipe_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_recipeingredient_fts_delete
+    AFTER DELETE ON api_recipeingredient BEGIN
+        UPDATE api_recipe_fts SET ingredients = coalesce(({
+            SQLITE_INGREDIENT_NAMES.format(recipe_id="OLD.recipe_id")
+        }), '') WHERE rowid = OLD.recipe_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_recipeingredient_fts_update
+    AFTER UPDATE OF recipe_id, ingredient_id ON api_recipeingredient BEGIN
+        UPDATE api_recipe_fts SET ingredients = coalesce(({
+            SQLITE_INGREDIENT_NAMES.format(recipe_id="api_recipe_fts.rowid")
+        }), '') WHERE rowid IN (OLD.recipe_id, NEW.recipe_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_ingredient_fts_update
+    AFTER UPDATE OF name ON api_ingredient
+    WHEN OLD.name IS NOT NEW.name BEGIN
+        UPDATE api_recipe_fts SET ingredients = ({
+            SQLITE_INGREDIENT_NAMES.format(recipe_id="api_recipe_fts.rowid")
+        }) WHERE rowid IN (
+            SELECT recipe_id FROM api_recipeingredient
+            WHERE ingredient_id = NEW.id
+        );
+    END
+    """,
+    f"""
+    INSERT INTO api_recipe_fts (rowid, title, ingredients, text)
+    SELECT id, title, coalesce(({
+        SQLITE_INGREDIENT_NAMES.format(recipe_id="api_recipe.id")
+    }), ''), text FROM api_recipe
+    """,
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER api_ingredient_fts_update",
+    "DROP TRIGGER api_recipeingredient_fts_update",
+    "DROP TRIGGER api_recipeingredient_fts_delete",
+    "DROP TRIGGER api_recipeingredient_fts_insert",
+    "DROP TRIGGER api_recipe_fts_delete",
+    "DROP TRIGGER api_recipe_fts_update",
+    "DROP TRIGGER api_recipe_fts_insert",
+    "DROP TABLE api_recipe_fts",
+]
+
+STATEMENTS = {
+    "postgresql": (POSTGRESQL_FORWARD, POSTGRESQL_BACKWARD),
+    "sqlite": (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def run(direction):
+    def operation(apps, schema_editor):
+        statements = STATEMENTS.get(schema_editor.connection.vendor)
+        # На прочих СУБД поиск работает без индекса (api.search).
+        for sql in statements[direction] if statements else ():
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0009_job"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(0), run(1)),
+    ]
@@ -0,0 +1,84 @@
+# Generated by Django 5.2.1 on 2026-10-18 19:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngredient = apps.get_model("api", "RecipeIngredient")
+    ShoppingListItem = apps.get_model("api", "ShoppingListItem")
+    rows = (
+        RecipeIngredient.objects.filter(recipe__in_cart__isnull=False)
+        .values("recipe__in_cart__user", "ingredient")
+        .annotate(
+            total=models.Sum("amount"), recipes=models.Count("recipe")
+        )
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row["recipe__in_cart__user"],
+                ingredient_id=row["ingredient"],
+                total_amount=row["total"],
+                recipes_count=row["recipes"],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0010_recipe_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShoppingListItem",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "total_amount",
+                    models.FloatField(verbose_name="Количество"),
+                ),
+                (
+                    "recipes_count",
+                    models.PositiveIntegerField(verbose_name="Рецептов"),
+                ),
+                (
+                    "ingredient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="api.ingredient",
+                        verbose_name="Ингредиент",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shopping_list",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Строка списка покупок",
+                "verbose_name_plural": "Строки списков покупок",
+                "unique_together": {("user", "ingredient")},
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 5.2.1 on 2026-10-18 20:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feeds(apps, schema_editor):
+    # Как при подписке: последние FEED_BACKFILL_SIZE рецептов авторов,
+    # которые не считаются популярными.
+    Follow = apps.get_model("api", "Follow")
+    Recipe = apps.get_model("api", "Recipe")
+    FeedEntry = apps.get_model("api", "FeedEntry")
+    authors = (
+        Follow.objects.filter(
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+        )
+        .values_list("author_id", flat=True)
+        .distinct()
+        .order_by()
+    )
+    for author_id in authors.iterator():
+        recipes = list(
+            Recipe.objects.filter(author_id=author_id)
+            .order_by("-pub_date", "-id")
+            .values_list("id", "pub_date")[: settings.FEED_BACKFILL_SIZE]
+        )
+        followers = Follow.objects.filter(author_id=author_id).values_list(
+            "user_id", flat=True
+        )
+        FeedEntry.objects.bulk_create(
+            (
+                FeedEntry(user_id=user_id, recipe_id=recipe_id, pub_date=date)
+                for user_id in followers.iterator()
+                for recipe_id, date in recipes
+            ),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0011_shopping_list"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FeedEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "pub_date",
+                    models.DateTimeField(
+                        verbose_name="Дата публикации рецепта"
+                    ),
+                ),
+                (
+                    "recipe",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed_entries",
+                        to="api.recipe",
+                        verbose_name="Рецепт",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="feed",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Подписчик",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Запись ленты",
+                "verbose_name_plural": "Ленты подписок",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-pub_date", "-recipe"],
+                        name="feed_user_pub_date_idx",
+                    )
+                ],
+                "unique_together": {("user", "recipe")},
+            },
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
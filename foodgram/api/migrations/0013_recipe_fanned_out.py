@@ -0,0 +1,73 @@
+# Generated by Django 5.2.1 on 2026-10-18 21:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# SQLite добавляет столбец NOT NULL, пересоздавая таблицу, и теряет её
+# триггеры полнотекстового поиска (0010_recipe_search); таблица
+# api_recipe_fts с уже проиндексированными рецептами не меняется.
+SQLITE_RECIPE_TRIGGERS = [
+    """
+    CREATE TRIGGER api_recipe_fts_insert AFTER INSERT ON api_recipe BEGIN
+        INSERT INTO api_recipe_fts (rowid, title, ingredients, text)
+        VALUES (NEW.id, NEW.title, '', NEW.text);
+    END
+    """,
+    """
+    CREATE TRIGGER api_recipe_fts_update
+    AFTER UPDATE OF title, text ON api_recipe BEGIN
+        UPDATE api_recipe_fts SET title = NEW.title, text = NEW.text
+        WHERE rowid = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_recipe_fts_delete AFTER DELETE ON api_recipe BEGIN
+        DELETE FROM api_recipe_fts WHERE rowid = OLD.id;
+    END
+    """,
+]
+
+
+def restore_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        for sql in SQLITE_RECIPE_TRIGGERS:
+            schema_editor.execute(sql)
+
+
+def mark_fanned_out(apps, schema_editor):
+    # До флага раскладывались рецепты всех авторов, кроме популярных.
+    Recipe = apps.get_model("api", "Recipe")
+    Recipe.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).update(fanned_out=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0012_feed_entry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="fanned_out",
+            field=models.BooleanField(
+                default=False,
+                editable=False,
+                verbose_name="Разложен по лентам подписчиков",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                condition=models.Q(("fanned_out", False)),
+                fields=["author", "-pub_date"],
+                name="recipe_unfanned_idx",
+            ),
+        ),
+        migrations.RunPython(
+            restore_search_triggers, migrations.RunPython.noop
+        ),
+        migrations.RunPython(mark_fanned_out, migrations.RunPython.noop),
+    ]
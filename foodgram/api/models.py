@@ -1,9 +1,29 @@
+import secrets
+import string
 import uuid
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 
+BASE62_ALPHABET = string.digits + string.ascii_letters
+
+
+def to_base62(number):
+    digits = []
+    while True:
+        number, remainder = divmod(number, len(BASE62_ALPHABET))
+        digits.append(BASE62_ALPHABET[remainder])
+        if not number:
+            return ''.join(reversed(digits))
+
+
+def generate_short_code():
+    """Короткий код ссылки на рецепт: 64 случайных бита в base62."""
+    return to_base62(secrets.randbits(64))
+
+
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     avatar = models.ImageField(
@@ -11,6 +31,9 @@ class CustomUser(AbstractUser):
         blank=True,
         null=True
     )
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    recipes_count = models.PositiveIntegerField('Рецептов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -26,6 +49,7 @@ class CustomUser(AbstractUser):
 class Ingredient(models.Model):
     name = models.CharField('Название', max_length=200, unique=True)
     unit = models.CharField('Ед. измерения', max_length=50)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -52,6 +76,12 @@ class Recipe(models.Model):
         'Изображение',
         upload_to='recipes/images/'
     )
+    image_variants = models.JSONField(
+        'Уменьшенные копии изображения',
+        default=dict,
+        blank=True,
+        editable=False
+    )
     ingredients = models.ManyToManyField(
         Ingredient,
         through='RecipeIngredient',
@@ -64,14 +94,45 @@ class Recipe(models.Model):
         editable=False,
         unique=True
     )
+    short_code = models.CharField(
+        'Код короткой ссылки',
+        max_length=11,
+        default=generate_short_code,
+        editable=False,
+        unique=True
+    )
     pub_date = models.DateTimeField(
         'Дата публикации',
         auto_now_add=True,
         db_index=True
     )
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    favorites_count = models.PositiveIntegerField(
+        'Добавлено в избранное', default=0
+    )
+    cart_count = models.PositiveIntegerField(
+        'Добавлено в список покупок', default=0
+    )
+    fanned_out = models.BooleanField(
+        'Разложен по лентам подписчиков', default=False, editable=False
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                condition=models.Q(fanned_out=False),
+                name='recipe_unfanned_idx'
+            ),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -121,6 +182,12 @@ class Favorite(models.Model):
 
     class Meta:
         unique_together = ('user', 'recipe')
+        indexes = [
+            models.Index(
+                fields=['user', 'recipe', 'added_at'],
+                name='favorite_user_recipe_added_idx'
+            ),
+        ]
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранное'
 
@@ -155,6 +222,35 @@ class CartItem(models.Model):
         return f'{self.recipe.title} в списке {self.user.username}'
 
 
+class ShoppingListItem(models.Model):
+    """
+    Материализованный список покупок: сумма ингредиента по рецептам
+    в корзине пользователя. Ведётся приращениями (api.shopping_cart).
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.FloatField('Количество')
+    recipes_count = models.PositiveIntegerField('Рецептов')
+
+    class Meta:
+        unique_together = ('user', 'ingredient')
+        verbose_name = 'Строка списка покупок'
+        verbose_name_plural = 'Строки списков покупок'
+
+    def __str__(self):
+        return f'{self.ingredient} в списке {self.user.username}'
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -175,8 +271,90 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'author')
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                name='follow_user_created_id_idx'
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return f'{self.user.username} подписан на {self.author.username}'
+
+
+class FeedEntry(models.Model):
+    """
+    Рецепт в ленте подписчика. Строки раскладывает фоновая задача
+    при публикации (api.feed); рецепты, опубликованные популярными
+    авторами, сюда не пишутся (Recipe.fanned_out) и подмешиваются
+    при чтении.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации рецепта')
+
+    class Meta:
+        unique_together = ('user', 'recipe')
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user.username}'
+
+
+class Job(models.Model):
+    """Фоновая задача; выполняется командой run_worker."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    task = models.CharField('Задача', max_length=255)
+    args = models.JSONField('Позиционные аргументы', default=list)
+    kwargs = models.JSONField('Именованные аргументы', default=dict)
+    status = models.CharField(
+        'Статус', max_length=16, choices=STATUSES, default=QUEUED
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Максимум попыток', default=5)
+    run_at = models.DateTimeField('Выполнить после', default=timezone.now)
+    locked_at = models.DateTimeField('Взята в работу', null=True, blank=True)
+    locked_by = models.CharField('Воркер', max_length=64, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    class Meta:
+        ordering = ('run_at', 'id')
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at', 'id'], name='job_status_run_at_idx'
+            ),
+        ]
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+
+    def __str__(self):
+        return f'{self.task} ({self.get_status_display()})'
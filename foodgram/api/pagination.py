@@ -1,5 +1,13 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class LimitPageNumberPagination(PageNumberPagination):
@@ -13,3 +21,155 @@ class LimitPageNumberPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data
         })
+
+
+class KeysetPagination(BasePagination):
+    """
+    Пагинация по ключу: следующая страница ищется условием
+    (pub_date, id) < (последние значения) по индексу, без OFFSET.
+    Поля сортировки берутся из `keyset_ordering` представления.
+    COUNT(*) считается только по запросу `?count=1`.
+    """
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(limit, 1), self.max_page_size)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(values) != len(self.ordering):
+                raise ValueError
+            return [
+                model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_position(self, position):
+        values = [
+            value.isoformat() if isinstance(value, (date, datetime))
+            else value
+            for value in position
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def encode_cursor(self, obj):
+        return self.encode_position(
+            getattr(obj, field.lstrip('-')) for field in self.ordering
+        )
+
+    def seek(self, position, names=None):
+        # (a, b) < (x, y)  ⇔  a < x OR (a = x AND b < y)
+        condition = Q()
+        equal = {}
+        names = names or [field.lstrip('-') for field in self.ordering]
+        for field, name, value in zip(self.ordering, names, position):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = view.keyset_ordering
+        self.limit = self.get_limit(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.seek(position))
+        page = list(queryset[:self.limit + 1])
+        self.next_cursor = (
+            self.encode_cursor(page[self.limit - 1])
+            if len(page) > self.limit else None
+        )
+        return page[:self.limit]
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param, self.next_cursor
+        )
+
+    def get_paginated_response(self, data):
+        response = {
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        }
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+
+class FeedPagination(KeysetPagination):
+    """
+    KeysetPagination по слиянию нескольких источников с общим ключом,
+    все поля которого сортируются в одном направлении. С каждого
+    источника читается не больше страницы после курсора.
+    """
+
+    def paginate_sources(self, sources, request, model, ordering):
+        """
+        `sources` — пары (запрос, имена полей ключа в его модели),
+        `model` и `ordering` описывают ключ курсора. Возвращает ключи
+        строк страницы; повторы из разных источников схлопываются.
+        """
+        self.request = request
+        self.ordering = ordering
+        self.limit = self.get_limit(request)
+        self.count = None
+        position = self.decode_cursor(request, model)
+        descending = ordering[0].startswith('-')
+        keys = set()
+        for queryset, names in sources:
+            queryset = queryset.order_by(*(
+                f'-{name}' if descending else name for name in names
+            ))
+            if position is not None:
+                queryset = queryset.filter(self.seek(position, names))
+            keys.update(queryset.values_list(*names)[:self.limit + 1])
+        keys = sorted(keys, reverse=descending)
+        self.next_cursor = (
+            self.encode_position(keys[self.limit - 1])
+            if len(keys) > self.limit else None
+        )
+        return keys[:self.limit]
+
+
+class KeysetPaginationMixin:
+    """
+    Включает KeysetPagination, если в запросе есть параметр `cursor`
+    (пустой — первая страница); иначе работает `pagination_class`.
+    """
+    keyset_ordering = None
+
+    @property
+    def paginator(self):
+        if (
+            not hasattr(self, '_paginator')
+            and self.keyset_ordering
+            and KeysetPagination.cursor_query_param in (
+                self.request.query_params
+            )
+        ):
+            self._paginator = KeysetPagination()
+        return super().paginator
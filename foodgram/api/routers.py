@@ -0,0 +1,92 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_COOKIE = 'primary_pin'
+PIN_SALT = 'api.routers.pin'
+
+_replica = ContextVar('replica', default=None)
+
+
+class ReplicaRouter:
+    """
+    Чтения внутри use_replica() уходят на реплику, всё остальное —
+    на основную БД. В открытой транзакции читаем с основной: иначе
+    не увидим собственных незакоммиченных изменений.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def choose_replica():
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+def use_replica(alias):
+    """Направляет чтения текущего контекста на `alias`; вернёт токен сброса."""
+    return _replica.set(alias)
+
+
+def reset_replica(token):
+    _replica.reset(token)
+
+
+def pin_to_primary(response, user):
+    """
+    Закрепление — подписанная cookie с id пользователя: её вернёт
+    следующий запрос клиента в любой воркер, общий кэш не нужен.
+    """
+    response.set_signed_cookie(
+        PIN_COOKIE, str(user.pk), salt=PIN_SALT,
+        max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+    )
+
+
+def is_pinned(request):
+    user = request.user
+    return user.is_authenticated and request.get_signed_cookie(
+        PIN_COOKIE, default=None, salt=PIN_SALT,
+        max_age=settings.REPLICA_PIN_SECONDS
+    ) == str(user.pk)
+
+
+class ReplicaReadMixin:
+    """
+    GET/HEAD-запросы представления читают с реплики. Пользователь,
+    недавно что-то изменивший, читает с основной БД, чтобы сразу
+    увидеть свои изменения (см. PrimaryPinMiddleware).
+    """
+
+    def initial(self, request, *args, **kwargs):
+        # Аутентификация — на основной БД: только что выданного токена
+        # на реплике может ещё не быть.
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(request):
+            alias = choose_replica()
+            if alias is not None:
+                self._replica_token = use_replica(alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = self.__dict__.pop('_replica_token', None)
+        if token is not None:
+            reset_replica(token)
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,84 @@
+"""
+Полнотекстовый поиск рецептов по названию, описанию и ингредиентам.
+
+Индексы ведут триггеры из миграции 0010_recipe_search: в PostgreSQL —
+столбец api_recipe.search_vector (tsvector, конфигурация russian) под
+GIN-индексом, в SQLite — таблица FTS5 api_recipe_fts. Результаты
+упорядочены по релевантности (ts_rank / bm25).
+"""
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe
+
+SEARCH_CONFIG = 'russian'
+# Веса столбцов FTS5 для bm25: название, ингредиенты, описание.
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+WORD_RE = re.compile(r'\w+')
+
+
+def fts_query(value):
+    """Слова запроса как префиксы через AND: «борщ» найдёт «борща»."""
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(value.lower()))
+
+
+def search_postgresql(queryset, value):
+    from django.contrib.postgres.search import (
+        SearchQuery, SearchRank, SearchVectorField
+    )
+
+    query = SearchQuery(value, config=SEARCH_CONFIG, search_type='websearch')
+    vector = RawSQL(
+        f'{Recipe._meta.db_table}.search_vector', (),
+        output_field=SearchVectorField()
+    )
+    return queryset.alias(search_vector=vector).filter(
+        search_vector=query
+    ).annotate(search_rank=SearchRank(F('search_vector'), query))
+
+
+def search_sqlite(queryset, value):
+    query = fts_query(value)
+    weights = ', '.join(map(str, FTS_WEIGHTS))
+    return queryset.filter(pk__in=RawSQL(
+        'SELECT rowid FROM api_recipe_fts WHERE api_recipe_fts MATCH %s',
+        (query,)
+    )).annotate(search_rank=RawSQL(
+        f'SELECT -bm25(api_recipe_fts, {weights}) FROM api_recipe_fts '
+        f'WHERE api_recipe_fts MATCH %s '
+        f'AND rowid = {Recipe._meta.db_table}.id',
+        (query,), output_field=FloatField()
+    ))
+
+
+def search_fallback(queryset, value):
+    # Прочие СУБД: без индекса и ранжирования, последовательный просмотр.
+    for word in WORD_RE.findall(value):
+        queryset = queryset.filter(
+            Q(title__icontains=word)
+            | Q(text__icontains=word)
+            | Q(ingredients__name__icontains=word)
+        )
+    return queryset.distinct().annotate(
+        search_rank=Value(0.0, output_field=FloatField())
+    )
+
+
+SEARCH_BACKENDS = {
+    'postgresql': search_postgresql,
+    'sqlite': search_sqlite,
+}
+
+
+def search_recipes(queryset, value):
+    """Рецепты, подходящие под запрос, от более релевантных к менее."""
+    if not WORD_RE.search(value):
+        return queryset.none()
+    vendor = connections[queryset.db].vendor
+    search = SEARCH_BACKENDS.get(vendor, search_fallback)
+    return search(queryset, value).order_by(
+        '-search_rank', *Recipe._meta.ordering, '-id'
+    )
@@ -1,6 +1,12 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework import serializers
-from drf_extra_fields.fields import Base64ImageField
+from .fields import (
+    LimitedBase64ImageField, RecipeImageField, RecipeImageVariantsField
+)
+from .images import schedule_variants
+from .indexes import pantry_index
+from .shopping_cart import apply_deltas, cart_users
 from .models import (
     CustomUser, Ingredient, Recipe, RecipeIngredient,
     Favorite, CartItem, Follow
@@ -21,6 +27,9 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        # Флаг может быть заранее проставлен аннотацией queryset-а.
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context['request'].user
         if user.is_anonymous:
             return False
@@ -61,15 +70,25 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image = RecipeImageField()
+    images = RecipeImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'title', 'image', 'text', 'cooking_time'
+            'is_in_shopping_cart', 'title', 'image', 'images', 'text',
+            'cooking_time'
         )
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed'):
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context['request'].user
         return (
             False if user.is_anonymous
@@ -77,6 +96,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context['request'].user
         return (
             False if user.is_anonymous
@@ -88,41 +109,117 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
     ingredients = serializers.ListField(
         child=serializers.DictField(), write_only=True
     )
-    image = Base64ImageField()
+    image = LimitedBase64ImageField()
 
     class Meta:
         model = Recipe
         fields = ('ingredients', 'image', 'title', 'text', 'cooking_time')
 
+    def validate_ingredients(self, value):
+        if not value:
+            raise serializers.ValidationError(
+                'Нужно указать хотя бы один ингредиент.'
+            )
+        amounts = {}
+        for item in value:
+            try:
+                ingredient_id = int(item['id'])
+                amount = float(item['amount'])
+            except (KeyError, TypeError, ValueError):
+                raise serializers.ValidationError(
+                    'Каждый ингредиент задаётся полями id и amount.'
+                )
+            if ingredient_id in amounts:
+                raise serializers.ValidationError(
+                    'Ингредиенты не должны повторяться.'
+                )
+            if amount <= 0:
+                raise serializers.ValidationError(
+                    'Количество ингредиента должно быть больше нуля.'
+                )
+            amounts[ingredient_id] = amount
+        found = Ingredient.objects.filter(pk__in=amounts).count()
+        if found != len(amounts):
+            raise serializers.ValidationError(
+                'Указан несуществующий ингредиент.'
+            )
+        return amounts
+
+    @transaction.atomic
     def create(self, validated_data):
-        ingredients_data = validated_data.pop('ingredients')
+        amounts = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(
             **validated_data,
             author=self.context['request'].user
         )
-        for item in ingredients_data:
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient_id=item['id'],
-                amount=item['amount']
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
             )
+            for ingredient_id, amount in amounts.items()
+        )
+        schedule_variants(recipe)
+        pantry_index.update_on_commit(recipe.pk, amounts)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('ingredients', None)
+        amounts = validated_data.pop('ingredients', None)
+        # Копии нового изображения строят сигналы рецепта.
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
-        if ingredients_data is not None:
-            instance.recipeingredient_set.all().delete()
-            for item in ingredients_data:
-                RecipeIngredient.objects.create(
-                    recipe=instance,
-                    ingredient_id=item['id'],
-                    amount=item['amount']
-                )
+        if amounts is not None:
+            self.update_ingredients(instance, amounts)
+            pantry_index.update_on_commit(instance.pk, amounts)
         return instance
 
+    def update_ingredients(self, recipe, amounts):
+        """
+        Приводит ингредиенты рецепта к `amounts` ({ingredient_id: amount}):
+        не более одного INSERT, UPDATE и DELETE, только по изменённым строкам.
+        """
+        current = {
+            item.ingredient_id: item
+            for item in recipe.recipe_ingredients.all()
+        }
+        to_create = []
+        to_update = []
+        # Приращения списков покупок тех, у кого рецепт в корзине.
+        deltas = {}
+        for ingredient_id, amount in amounts.items():
+            item = current.get(ingredient_id)
+            if item is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount
+                ))
+                deltas[ingredient_id] = (amount, 1)
+            elif item.amount != amount:
+                deltas[ingredient_id] = (amount - item.amount, 0)
+                item.amount = amount
+                to_update.append(item)
+        to_delete = []
+        for ingredient_id, item in current.items():
+            if ingredient_id not in amounts:
+                to_delete.append(item.pk)
+                deltas[ingredient_id] = (-item.amount, -1)
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if deltas:
+            apply_deltas(cart_users(recipe.pk), deltas)
+
+
+class PantryRecipeSerializer(RecipeReadSerializer):
+    coverage = serializers.FloatField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('coverage', 'missing')
+
 
 class FavoriteSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='recipe.id', read_only=True)
@@ -150,10 +247,18 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'image', 'cooking_time')
 
 
+def get_recipes_limit(request, default=3):
+    try:
+        limit = int(request.query_params.get('recipes_limit', default))
+    except ValueError:
+        return default
+    return max(limit, 0)
+
+
 class SubscriptionRecipeSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
     title = serializers.CharField()
-    image = serializers.ImageField()
+    image = RecipeImageField(variant='thumb')
     cooking_time = serializers.IntegerField()
 
     class Meta:
@@ -192,12 +297,15 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         return True
 
     def get_recipes(self, obj):
-        limit = int(self.context['request'].query_params.get(
-            'recipes_limit',
-            3)
-        )
-        recipes = Recipe.objects.filter(author=obj.author)[:limit]
-        return SubscriptionRecipeSerializer(recipes, many=True).data
+        previews = self.context.get('recipes_preview')
+        if previews is not None:
+            recipes = previews.get(obj.author_id, [])
+        else:
+            limit = get_recipes_limit(self.context['request'])
+            recipes = Recipe.objects.filter(author=obj.author)[:limit]
+        return SubscriptionRecipeSerializer(
+            recipes, many=True, context=self.context
+        ).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
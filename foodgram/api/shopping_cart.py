@@ -0,0 +1,223 @@
+"""
+Список покупок пользователя.
+
+Суммы ингредиентов по рецептам корзины хранятся в ShoppingListItem
+и сдвигаются на приращения: при добавлении и удалении рецепта
+из корзины и при правке ингредиентов рецепта, который лежит в чьих-то
+корзинах. recipes_count — число рецептов, давших строку: на нуле
+строка удаляется, поэтому погрешность сложения float не накапливается.
+Сверка с полным пересчётом — команда check_shopping_lists.
+"""
+import csv
+import math
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import CartItem, RecipeIngredient, ShoppingListItem
+
+User = get_user_model()
+
+CHUNK_SIZE = 500
+
+
+def shopping_cart_totals(user):
+    """
+    Суммарное количество каждого ингредиента по всем рецептам
+    в списке покупок пользователя — чтение готовых строк по индексу.
+    """
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .values(
+            name=F('ingredient__name'),
+            unit=F('ingredient__unit'),
+            total=F('total_amount')
+        )
+        .order_by('name', 'unit')
+    )
+
+
+def actual_totals(user_ids=None):
+    """Полный пересчёт: (user_id, ingredient_id) → (сумма, рецептов)."""
+    # Одно условие filter(): отдельные вызовы по многозначной связи
+    # дали бы два JOIN корзины и задвоили суммы.
+    lookup = (
+        {'recipe__in_cart__user__in': user_ids} if user_ids is not None
+        else {'recipe__in_cart__isnull': False}
+    )
+    rows = RecipeIngredient.objects.filter(**lookup).values(
+        'recipe__in_cart__user', 'ingredient'
+    ).annotate(
+        total=Sum('amount'), recipes=Count('recipe')
+    ).order_by()
+    return {
+        (row['recipe__in_cart__user'], row['ingredient']):
+            (row['total'], row['recipes'])
+        for row in rows.iterator(chunk_size=CHUNK_SIZE)
+    }
+
+
+def cart_users(recipe_id):
+    return list(
+        CartItem.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True
+        )
+    )
+
+
+def recipe_deltas(recipe_id, sign):
+    return {
+        ingredient_id: (sign * amount, sign)
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount')
+    }
+
+
+def lock_users(user_ids):
+    # Правки списков одного пользователя выполняются по очереди:
+    # иначе параллельные INSERT одной строки упрутся в unique_together.
+    list(
+        User.objects.filter(pk__in=user_ids).order_by('pk')
+        .select_for_update().values_list('pk', flat=True)
+    )
+
+
+@transaction.atomic
+def apply_deltas(user_ids, deltas):
+    """
+    Сдвигает строки списков покупок пользователей user_ids на deltas —
+    {ingredient_id: (количество, число рецептов)}.
+    """
+    deltas = {
+        ingredient_id: delta for ingredient_id, delta in deltas.items()
+        if delta != (0, 0)
+    }
+    user_ids = sorted(set(user_ids))
+    if not deltas:
+        return
+    for start in range(0, len(user_ids), CHUNK_SIZE):
+        chunk = user_ids[start:start + CHUNK_SIZE]
+        lock_users(chunk)
+        current = {
+            (item.user_id, item.ingredient_id): item
+            for item in ShoppingListItem.objects.filter(
+                user_id__in=chunk, ingredient_id__in=deltas
+            )
+        }
+        to_create = []
+        to_update = []
+        to_delete = []
+        for user_id in chunk:
+            for ingredient_id, (amount, count) in deltas.items():
+                item = current.get((user_id, ingredient_id))
+                if item is None:
+                    if count > 0:
+                        to_create.append(ShoppingListItem(
+                            user_id=user_id, ingredient_id=ingredient_id,
+                            total_amount=amount, recipes_count=count
+                        ))
+                elif item.recipes_count + count <= 0:
+                    to_delete.append(item.pk)
+                else:
+                    item.total_amount += amount
+                    item.recipes_count += count
+                    to_update.append(item)
+        if to_delete:
+            ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ShoppingListItem.objects.bulk_update(
+                to_update, ['total_amount', 'recipes_count']
+            )
+        if to_create:
+            ShoppingListItem.objects.bulk_create(to_create)
+
+
+def add_recipe(user_ids, recipe_id):
+    apply_deltas(user_ids, recipe_deltas(recipe_id, 1))
+
+
+def remove_recipe(user_ids, recipe_id):
+    apply_deltas(user_ids, recipe_deltas(recipe_id, -1))
+
+
+@transaction.atomic
+def rebuild_shopping_lists(user_ids=None):
+    """Пересобирает списки пользователей (всех — без user_ids)."""
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        user_ids = sorted(set(user_ids))
+        lock_users(user_ids)
+        items = items.filter(user_id__in=user_ids)
+    items.delete()
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id,
+                total_amount=total, recipes_count=recipes
+            )
+            for (user_id, ingredient_id), (total, recipes)
+            in actual_totals(user_ids).items()
+        ),
+        batch_size=CHUNK_SIZE
+    )
+
+
+def shopping_list_discrepancies():
+    """
+    Расхождения сохранённых списков с полным пересчётом:
+    (user_id, ingredient_id, сохранено, должно быть), где значение —
+    пара (количество, рецептов) или None, если строки нет.
+    """
+    expected = actual_totals()
+    stored = {
+        (user_id, ingredient_id): (total, recipes)
+        for user_id, ingredient_id, total, recipes
+        in ShoppingListItem.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount', 'recipes_count'
+        ).iterator(chunk_size=CHUNK_SIZE)
+    }
+    for key in sorted(expected.keys() | stored.keys()):
+        have, want = stored.get(key), expected.get(key)
+        if have is None or want is None or have[1] != want[1] or not (
+            math.isclose(have[0], want[0], rel_tol=1e-9, abs_tol=1e-9)
+        ):
+            yield (*key, have, want)
+
+
+def format_amount(amount):
+    # Без экспоненты и округления до 6 значащих цифр, как у формата g.
+    return f'{amount:.6f}'.rstrip('0').rstrip('.')
+
+
+def iter_txt(rows):
+    yield 'Список покупок\n\n'
+    for row in rows:
+        yield (
+            f'{row["name"]} ({row["unit"]}) — '
+            f'{format_amount(row["total"])}\n'
+        )
+
+
+class _Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(('name', 'unit', 'amount'))
+    for row in rows:
+        yield writer.writerow(
+            (row['name'], row['unit'], format_amount(row['total']))
+        )
+
+
+FORMATS = {
+    'txt': (iter_txt, 'text/plain; charset=utf-8'),
+    'csv': (iter_csv, 'text/csv; charset=utf-8'),
+}
@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.http import Http404, HttpResponseRedirect
+from django.utils.cache import patch_cache_control
+
+from .lru import LRUCache
+from .models import Recipe
+
+# Код ссылки не меняется, поэтому соответствие код → id рецепта
+# можно держать в памяти; удалённые рецепты вычищаются сигналом.
+short_link_cache = LRUCache(settings.SHORT_LINK_CACHE_SIZE)
+
+
+def resolve_short_code(code):
+    recipe_id = short_link_cache.get(code)
+    if recipe_id is None:
+        recipe_id = Recipe.objects.filter(
+            short_code=code
+        ).values_list('id', flat=True).first()
+        if recipe_id is None:
+            return None
+        short_link_cache.set(code, recipe_id)
+    return recipe_id
+
+
+async def aresolve_short_code(code):
+    recipe_id = short_link_cache.get(code)
+    if recipe_id is None:
+        recipe_id = await Recipe.objects.filter(
+            short_code=code
+        ).values_list('id', flat=True).afirst()
+        if recipe_id is None:
+            return None
+        short_link_cache.set(code, recipe_id)
+    return recipe_id
+
+
+def redirect_to_recipe(recipe_id):
+    if recipe_id is None:
+        raise Http404('Ссылка не найдена')
+    response = HttpResponseRedirect(f'/recipes/{recipe_id}')
+    patch_cache_control(
+        response, public=True, max_age=settings.SHORT_LINK_MAX_AGE
+    )
+    return response
+
+
+def short_link_redirect(request, code):
+    """/s/{code}/ → страница рецепта во фронтенде."""
+    return redirect_to_recipe(resolve_short_code(code))
+
+
+async def ashort_link_redirect(request, code):
+    """Асинхронный вариант short_link_redirect для ASGI."""
+    return redirect_to_recipe(await aresolve_short_code(code))
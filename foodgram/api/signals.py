@@ -0,0 +1,203 @@
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import (
+    post_delete, post_save, pre_delete, pre_save
+)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import cache
+from .authentication import forget_tokens, forget_user_tokens
+from .counters import COUNTERS, change_counter
+from .feed import backfill_feed, forget_author, schedule_fan_out
+from .images import schedule_variants
+from .indexes import ingredient_index, pantry_index
+from .middleware import install_query_recorder
+from .models import (
+    CartItem, Favorite, Follow, Ingredient, Recipe, RecipeIngredient
+)
+from .shopping_cart import (
+    add_recipe, apply_deltas, cart_users, rebuild_shopping_lists,
+    remove_recipe
+)
+from .shortlinks import short_link_cache
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+    cache.invalidate_catalog()
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(instance, **kwargs):
+    short_link_cache.delete(instance.short_code)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_pantry_recipe(instance, **kwargs):
+    pantry_index.update_on_commit(instance.pk, ())
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def refresh_pantry_recipe(instance, origin=None, **kwargs):
+    # Удаление через queryset (сериализатор, админка) шлёт сигнал на каждую
+    # строку, а индекс там обновляется один раз на рецепт; при удалении
+    # рецепта хватает forget_pantry_recipe.
+    if not isinstance(origin, (Recipe, QuerySet)):
+        pantry_index.update_on_commit(instance.recipe_id)
+
+
+@receiver(post_save, sender=CartItem)
+def add_to_shopping_list(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        add_recipe([instance.user_id], instance.recipe_id)
+
+
+@receiver(post_delete, sender=CartItem)
+def remove_from_shopping_list(instance, origin=None, **kwargs):
+    # Вместе с пользователем уходит и его список; удаление рецепта
+    # вычитается в subtract_deleted_recipe, пока ингредиенты на месте.
+    if not isinstance(origin, (Recipe, get_user_model())):
+        remove_recipe([instance.user_id], instance.recipe_id)
+
+
+@receiver(pre_delete, sender=Recipe)
+def subtract_deleted_recipe(instance, **kwargs):
+    remove_recipe(cart_users(instance.pk), instance.pk)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def shopping_list_ingredient_saved(instance, created, raw=False, **kwargs):
+    # Пакетные правки (сериализатор, массовое удаление в админке) сдвигают
+    # списки сами; здесь — одиночные сохранения и удаления.
+    if raw:
+        return
+    if created:
+        apply_deltas(
+            cart_users(instance.recipe_id),
+            {instance.ingredient_id: (instance.amount, 1)}
+        )
+    else:
+        # Прежнее количество и ингредиент неизвестны — пересборка.
+        rebuild_shopping_lists(cart_users(instance.recipe_id))
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def shopping_list_ingredient_deleted(instance, origin=None, **kwargs):
+    if not isinstance(origin, (Recipe, QuerySet)):
+        apply_deltas(
+            cart_users(instance.recipe_id),
+            {instance.ingredient_id: (-instance.amount, -1)}
+        )
+
+
+@receiver(pre_save, sender=Recipe)
+def detect_image_change(instance, raw=False, update_fields=None, **kwargs):
+    # Изображение меняют сериализатор, админка и код: копии прежнего
+    # сбрасываются при любом сохранении, где сменилось имя файла.
+    if raw or instance._state.adding or (
+        update_fields is not None and 'image' not in update_fields
+    ):
+        return
+    previous = Recipe.objects.filter(pk=instance.pk).values_list(
+        'image', 'image_variants'
+    ).first()
+    if previous is None or previous[0] == instance.image.name:
+        return
+    instance._stale_variants = list((previous[1] or {}).values())
+    instance.image_variants = {}
+
+
+@receiver(post_save, sender=Recipe)
+def rebuild_image_variants(instance, created, raw=False, **kwargs):
+    # Копии нового рецепта ставит в очередь сериализатор.
+    stale = instance.__dict__.pop('_stale_variants', None)
+    if stale is not None and not raw:
+        schedule_variants(instance, stale)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        schedule_fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_subscriber_feed(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        backfill_feed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clean_subscriber_feed(instance, origin=None, **kwargs):
+    # С удалением пользователя его лента или рецепты уходят каскадом.
+    if not isinstance(origin, get_user_model()):
+        forget_author(instance.user_id, instance.author_id)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe_cache(instance, **kwargs):
+    cache.invalidate_recipe(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def invalidate_recipe_ingredients_cache(instance, origin=None, raw=False,
+                                        **kwargs):
+    cache.invalidate_recipe(instance.recipe_id)
+    # Состав попадает в ETag и Last-Modified рецепта через updated_at;
+    # пакетные правки (сериализатор, админка) обновляют рецепт сами.
+    if not raw and not isinstance(origin, (Recipe, QuerySet)):
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            updated_at=timezone.now()
+        )
+
+
+@receiver((post_save, post_delete), sender=get_user_model())
+def invalidate_user_cache(instance, update_fields=None, **kwargs):
+    # Вход в систему обновляет только last_login — в ответах его нет.
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=get_user_model())
+def forget_user_auth(instance, created, update_fields=None, **kwargs):
+    # Смена пароля, блокировка и любые другие изменения пользователя.
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    forget_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(instance, **kwargs):
+    # Выход (token/logout) и каскадное удаление вместе с пользователем.
+    forget_tokens([instance.key])
+
+
+def invalidate_user_state_cache(instance, **kwargs):
+    cache.invalidate_user_state(instance.user_id)
+
+
+for user_state_model in (Favorite, CartItem, Follow):
+    post_save.connect(invalidate_user_state_cache, sender=user_state_model)
+    post_delete.connect(invalidate_user_state_cache, sender=user_state_model)
+
+
+def increment_counter(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(instance, 1)
+
+
+def decrement_counter(instance, **kwargs):
+    change_counter(instance, -1)
+
+
+for counted_model in COUNTERS:
+    post_save.connect(increment_counter, sender=counted_model)
+    post_delete.connect(decrement_counter, sender=counted_model)
+
+
+connection_created.connect(install_query_recorder)
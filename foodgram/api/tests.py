@@ -1,3 +1,1811 @@
-from django.test import TestCase
+import base64
+import os
+import random
+import tempfile
+from array import array
+from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
+
+from . import async_views
+from .authentication import (
+    TOKEN_KEY, CachedTokenAuthentication, token_cache
+)
+from .indexes import PantrySnapshot, ingredient_index, pantry_index
+from .jobs import claim, enqueue, run_job
+from .metrics import registry
+from .models import (
+    Ingredient, Recipe, RecipeIngredient, Favorite, CartItem, Follow, Job,
+    FeedEntry, ShoppingListItem
+)
+from .routers import (
+    PIN_COOKIE, ReplicaRouter, reset_replica, use_replica
+)
+from .serializers import RecipeReadSerializer, RecipeWriteSerializer
+from .shopping_cart import shopping_list_discrepancies
+from .shortlinks import ashort_link_redirect, short_link_cache
+from .warmup import warm_up
+
+User = get_user_model()
+
+
+class QueryBudgetMixin:
+    """Проверка, что запрос укладывается в фиксированный бюджет SQL."""
+
+    def assertQueryBudget(self, budget, func, *args, **kwargs):
+        with CaptureQueriesContext(connection) as ctx:
+            result = func(*args, **kwargs)
+        self.assertLessEqual(
+            len(ctx.captured_queries), budget,
+            '\n'.join(query['sql'] for query in ctx.captured_queries)
+        )
+        return result
+
+
+def create_recipes(author, ingredients, count):
+    recipes = []
+    for number in range(count):
+        recipe = Recipe.objects.create(
+            author=author,
+            title=f'Рецепт {number}',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/test.png',
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        recipes.append(recipe)
+    return recipes
+
+
+def image_payload(size=(4, 4), image_format='PNG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+class RecipeListQueriesTest(QueryBudgetMixin, APITestCase):
+    # COUNT пагинации + список рецептов + prefetch ингредиентов;
+    # ETag списка строится по версиям кэша, без запросов.
+    RECIPE_LIST_BUDGET = 3
+    RECIPE_LIST_AUTHENTICATED_BUDGET = 3
+    RECIPE_DETAIL_BUDGET = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='reader@example.com', username='reader'
+        )
+        authors = [
+            User.objects.create_user(
+                email=f'author{number}@example.com',
+                username=f'author{number}',
+            )
+            for number in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', unit='г')
+            for number in range(5)
+        )
+        recipes = []
+        for author in authors:
+            recipes.extend(create_recipes(author, ingredients, 5))
+        Favorite.objects.create(user=cls.user, recipe=recipes[0])
+        CartItem.objects.create(user=cls.user, recipe=recipes[1])
+        Follow.objects.create(user=cls.user, author=authors[0])
+
+    def setUp(self):
+        cache.clear()
+        ingredient_index.get()
+
+    def test_anonymous_list_within_budget(self):
+        response = self.assertQueryBudget(
+            self.RECIPE_LIST_BUDGET, self.client.get, '/api/recipes/',
+            {'limit': 15}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any(
+            recipe['is_favorited'] or recipe['author']['is_subscribed']
+            for recipe in response.data['results']
+        ))
+
+    def test_authenticated_list_within_budget(self):
+        self.client.force_authenticate(self.user)
+        response = self.assertQueryBudget(
+            self.RECIPE_LIST_AUTHENTICATED_BUDGET,
+            self.client.get, '/api/recipes/', {'limit': 15}
+        )
+        self.assertEqual(response.status_code, 200)
+        recipes = response.data['results']
+        self.assertEqual(len(recipes), 15)
+        self.assertEqual(sum(recipe['is_favorited'] for recipe in recipes), 1)
+        self.assertEqual(
+            sum(recipe['is_in_shopping_cart'] for recipe in recipes), 1
+        )
+        self.assertEqual(
+            sum(recipe['author']['is_subscribed'] for recipe in recipes), 5
+        )
+        self.assertEqual(len(recipes[0]['ingredients']), 5)
+
+    def test_retrieve_within_budget(self):
+        self.client.force_authenticate(self.user)
+        recipe = Recipe.objects.first()
+        response = self.assertQueryBudget(
+            self.RECIPE_DETAIL_BUDGET, self.client.get,
+            f'/api/recipes/{recipe.pk}/'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class DownloadShoppingCartTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='buyer@example.com', username='buyer'
+        )
+        ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name='мука', unit='г'),
+            Ingredient(name='молоко', unit='мл'),
+        ])
+        for recipe in create_recipes(cls.user, ingredients, 3):
+            CartItem.objects.create(user=cls.user, recipe=recipe)
+
+    def download(self, **params):
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', params
+        )
+        content = b''.join(response.streaming_content).decode()
+        return response, content
+
+    def test_totals_in_one_query(self):
+        self.client.force_authenticate(self.user)
+        response, content = self.assertQueryBudget(1, self.download)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('молоко (мл) — 3', content)
+        self.assertIn('мука (г) — 3', content)
+
+    def test_csv(self):
+        self.client.force_authenticate(self.user)
+        response, content = self.download(type='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(
+            content.splitlines(),
+            ['name,unit,amount', 'молоко,мл,3', 'мука,г,3']
+        )
+
+    def test_large_and_fractional_totals(self):
+        self.client.force_authenticate(self.user)
+        items = ShoppingListItem.objects.filter(user=self.user)
+        items.filter(ingredient__name='мука').update(total_amount=1234567)
+        items.filter(ingredient__name='молоко').update(total_amount=0.25)
+        _response, content = self.download(type='csv')
+        self.assertEqual(
+            content.splitlines()[1:],
+            ['молоко,мл,0.25', 'мука,г,1234567']
+        )
+
+    def test_anonymous_forbidden(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 401)
+
+
+class IngredientIndexTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create([
+            Ingredient(name='Абрикосы', unit='г'),
+            Ingredient(name='абрикосовый сок', unit='мл'),
+            Ingredient(name='авокадо', unit='шт'),
+            Ingredient(name='баклажаны', unit='г'),
+        ])
+        cls.user = User.objects.create_user(
+            email='cook@example.com', username='cook'
+        )
+
+    def setUp(self):
+        ingredient_index.invalidate()
+        self.client.force_authenticate(self.user)
+
+    def names(self, response):
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_search_is_case_insensitive_and_sorted(self):
+        self.client.get('/api/ingredients/')
+        response = self.assertQueryBudget(
+            0, self.client.get, '/api/ingredients/', {'name': 'АБР'}
+        )
+        self.assertEqual(
+            self.names(response), ['абрикосовый сок', 'Абрикосы']
+        )
+
+    def test_index_follows_model_changes(self):
+        self.client.get('/api/ingredients/')
+        ingredient = Ingredient.objects.create(name='абрикосовый джем',
+                                               unit='г')
+        response = self.client.get('/api/ingredients/', {'name': 'абрикосов'})
+        self.assertEqual(
+            self.names(response), ['абрикосовый джем', 'абрикосовый сок']
+        )
+        ingredient.delete()
+        response = self.client.get('/api/ingredients/', {'name': 'абрикосов'})
+        self.assertEqual(self.names(response), ['абрикосовый сок'])
+
+
+class ImportIngredientsTest(APITestCase):
+
+    def import_file(self, suffix, content, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / f'ingredients{suffix}'
+            path.write_text(content, encoding='utf-8')
+            call_command(
+                'import_ingredients', str(path), *args, stdout=StringIO()
+            )
+
+    def test_csv_import_is_idempotent_and_updates_units(self):
+        self.import_file('.csv', 'мука,г\nмолоко,мл\nмука,кг\n,г\n')
+        self.import_file('.csv', 'мука,г\nмолоко,л\n', '--batch-size', '1')
+        self.assertEqual(
+            dict(Ingredient.objects.values_list('name', 'unit')),
+            {'мука': 'г', 'молоко': 'л'}
+        )
+
+    def test_reimport_keeps_unchanged_rows(self):
+        self.import_file('.csv', 'мука,г\nмолоко,мл\n')
+        before = dict(Ingredient.objects.values_list('name', 'updated_at'))
+        self.import_file('.csv', 'мука,г\nмолоко,л\n')
+        after = dict(Ingredient.objects.values_list('name', 'updated_at'))
+        self.assertEqual(after['мука'], before['мука'])
+        self.assertGreater(after['молоко'], before['молоко'])
+
+    def test_json_and_ndjson(self):
+        self.import_file(
+            '.json', '[{"name": "соль", "measurement_unit": "г"}]'
+        )
+        self.import_file(
+            '.ndjson', '{"name": "сахар", "measurement_unit": "г"}\n'
+        )
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list('name', flat=True)),
+            ['сахар', 'соль']
+        )
+
+    def test_dry_run_writes_nothing(self):
+        self.import_file('.csv', 'мука,г\n', '--dry-run')
+        self.assertFalse(Ingredient.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeWriteTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='chef@example.com', username='chef'
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', unit='г')
+            for number in range(40)
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def payload(self, ingredients, amount=1):
+        return {
+            'ingredients': [
+                {'id': ingredient.pk, 'amount': amount}
+                for ingredient in ingredients
+            ],
+        }
+
+    def amounts(self, recipe):
+        return dict(
+            recipe.recipe_ingredients.values_list('ingredient_id', 'amount')
+        )
+
+    def test_create(self):
+        response = self.client.post('/api/recipes/', {
+            **self.payload(self.ingredients[:3], amount=5),
+            'image': image_payload(),
+            'title': 'Суп',
+            'text': 'Сварить',
+            'cooking_time': 30,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            self.amounts(recipe),
+            {ingredient.pk: 5 for ingredient in self.ingredients[:3]}
+        )
+
+    def test_duplicate_ingredients_rejected(self):
+        recipe = create_recipes(self.author, self.ingredients[:1], 1)[0]
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/',
+            self.payload(self.ingredients[:1] * 2), format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_update_applies_diff(self):
+        recipe = create_recipes(self.author, self.ingredients[:3], 1)[0]
+        payload = self.payload(self.ingredients[1:4])
+        payload['ingredients'][0]['amount'] = 7
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/', payload, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.amounts(recipe), {
+            self.ingredients[1].pk: 7,
+            self.ingredients[2].pk: 1,
+            self.ingredients[3].pk: 1,
+        })
+
+    def count_update_queries(self, old, new):
+        recipe = create_recipes(self.author, old, 1)[0]
+        pantry_index.invalidate()
+        pantry_index.get()
+        # Считаются и отложенные до фиксации обновления кэша и индексов.
+        with CaptureQueriesContext(connection) as ctx:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.patch(
+                    f'/api/recipes/{recipe.pk}/',
+                    self.payload(new, amount=2), format='json'
+                )
+        self.assertEqual(
+            self.amounts(recipe), {ingredient.pk: 2 for ingredient in new}
+        )
+        return len(ctx.captured_queries)
+
+    def test_update_query_count_does_not_grow(self):
+        small = self.count_update_queries(
+            self.ingredients[:3], self.ingredients[2:5]
+        )
+        large = self.count_update_queries(
+            self.ingredients[:30], self.ingredients[10:40]
+        )
+        self.assertEqual(small, large)
+
+    def test_dropping_ingredients_query_count_does_not_grow(self):
+        one = self.count_update_queries(
+            self.ingredients[:11], self.ingredients[:10]
+        )
+        ten = self.count_update_queries(
+            self.ingredients[:20], self.ingredients[:10]
+        )
+        self.assertEqual(one, ten)
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(), BACKGROUND_TASKS_EAGER=True
+)
+class RecipeImageVariantsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='photo@example.com', username='photo'
+        )
+        cls.ingredient = Ingredient.objects.create(name='соль', unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.author)
+
+    def create(self, image, status_code=201):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'ingredients': [{'id': self.ingredient.pk, 'amount': 1}],
+                'image': image,
+                'title': 'Пирог',
+                'text': 'Испечь',
+                'cooking_time': 40,
+            }, format='json')
+        self.assertEqual(response.status_code, status_code, response.data)
+        return response
+
+    def test_variants_built_after_commit(self):
+        self.create(image_payload(size=(1000, 600)))
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            set(recipe.image_variants), {'detail', 'list', 'thumb'}
+        )
+        path = Path(settings.MEDIA_ROOT) / recipe.image_variants['list']
+        with Image.open(path) as image:
+            self.assertEqual(image.size, (480, 288))
+        listing = self.client.get('/api/recipes/').data['results'][0]
+        self.assertTrue(listing['image'].endswith('_list.webp'))
+        detail = self.client.get(f'/api/recipes/{recipe.pk}/').data
+        self.assertTrue(detail['image'].endswith('_detail.webp'))
+        self.assertIn('/media/recipes/images/', detail['images']['original'])
+
+    def test_new_image_replaces_variants(self):
+        self.create(image_payload())
+        recipe = Recipe.objects.get()
+        old = Path(settings.MEDIA_ROOT) / recipe.image_variants['thumb']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.pk}/',
+                {'image': image_payload(image_format='JPEG')}, format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.data)
+        recipe.refresh_from_db()
+        self.assertFalse(old.exists())
+        self.assertTrue(
+            (Path(settings.MEDIA_ROOT) / recipe.image_variants['thumb'])
+            .exists()
+        )
+
+    def test_image_replaced_outside_api(self):
+        # Так изображение меняет, например, форма рецепта в админке.
+        self.create(image_payload())
+        recipe = Recipe.objects.get()
+        old = Path(settings.MEDIA_ROOT) / recipe.image_variants['detail']
+        buffer = BytesIO()
+        Image.new('RGB', (8, 8), 'green').save(buffer, 'PNG')
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.image.save('new.png', ContentFile(buffer.getvalue()))
+        self.assertFalse(old.exists())
+        detail = self.client.get(f'/api/recipes/{recipe.pk}/').data
+        recipe.refresh_from_db()
+        self.assertTrue(
+            detail['image'].endswith(recipe.image_variants['detail'])
+        )
+        self.assertIn('new', recipe.image_variants['detail'])
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=64)
+    def test_oversized_upload_rejected(self):
+        response = self.create(image_payload(size=(64, 64)), 400)
+        self.assertIn('image', response.data)
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_too_many_pixels_rejected(self):
+        response = self.create(image_payload(size=(20, 20)), 400)
+        self.assertIn('image', response.data)
+
+
+class SubscriptionListQueriesTest(QueryBudgetMixin, APITestCase):
+    # COUNT + подписки с числом рецептов + превью оконным запросом.
+    SUBSCRIPTION_LIST_BUDGET = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='follower@example.com', username='follower'
+        )
+        for number in range(10):
+            author = User.objects.create_user(
+                email=f'writer{number}@example.com',
+                username=f'writer{number}',
+            )
+            create_recipes(author, [], number % 5)
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_list_within_budget(self):
+        response = self.assertQueryBudget(
+            self.SUBSCRIPTION_LIST_BUDGET, self.client.get,
+            '/api/users/subscriptions/', {'recipes_limit': 2, 'limit': 10}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 10)
+        for subscription in response.data['results']:
+            author = User.objects.get(pk=subscription['id'])
+            latest = list(
+                author.recipes.values_list('id', flat=True)[:2]
+            )
+            self.assertEqual(
+                [recipe['id'] for recipe in subscription['recipes']], latest
+            )
+            self.assertEqual(
+                subscription['recipes_count'], author.recipes.count()
+            )
+
+
+class ShortLinkTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email='linker@example.com', username='linker'
+        )
+        cls.recipe = create_recipes(author, [], 1)[0]
+
+    def setUp(self):
+        short_link_cache.clear()
+
+    def test_get_link_resolves_to_recipe(self):
+        response = self.client.get(f'/api/recipes/{self.recipe.pk}/get-link/')
+        link = response.data['short-link']
+        self.assertRegex(link, r'/s/[0-9A-Za-z]{1,11}/$')
+        response = self.client.get(link)
+        self.assertRedirects(
+            response, f'/recipes/{self.recipe.pk}',
+            fetch_redirect_response=False
+        )
+        self.assertIn('max-age', response['Cache-Control'])
+
+    def test_hot_link_served_from_memory(self):
+        url = f'/s/{self.recipe.short_code}/'
+        self.client.get(url)
+        response = self.assertQueryBudget(0, self.client.get, url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_deleted_recipe_link_is_gone(self):
+        url = f'/s/{self.recipe.short_code}/'
+        self.client.get(url)
+        self.recipe.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class AnonymousRecipeCacheTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email='cached@example.com', username='cached'
+        )
+        cls.ingredient = Ingredient.objects.create(name='соль', unit='г')
+        cls.recipe = create_recipes(cls.author, [cls.ingredient], 1)[0]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_reads_hit_cache(self):
+        for url in ('/api/recipes/', f'/api/recipes/{self.recipe.pk}/'):
+            first = self.client.get(url)
+            second = self.assertQueryBudget(0, self.client.get, url)
+            self.assertEqual(first.data, second.data)
+
+    def test_authenticated_reads_bypass_cache(self):
+        self.client.get('/api/recipes/')
+        self.client.force_authenticate(self.author)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/recipes/')
+        self.assertTrue(ctx.captured_queries)
+
+    def test_recipe_change_invalidates(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(url)
+        self.client.get('/api/recipes/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.title = 'Новое название'
+            self.recipe.save()
+        self.assertEqual(self.client.get(url).data['title'], 'Новое название')
+        self.assertEqual(
+            self.client.get('/api/recipes/').data['results'][0]['title'],
+            'Новое название'
+        )
+
+    def test_author_and_ingredient_changes_invalidate(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Иван'
+            self.author.save()
+        self.assertEqual(
+            self.client.get(url).data['author']['first_name'], 'Иван'
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredient.unit = 'кг'
+            self.ingredient.save()
+        self.assertEqual(
+            self.client.get(url).data['ingredients'][0]['unit'], 'кг'
+        )
+
+
+class ConditionalGetTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='etag@example.com', username='etag'
+        )
+        Ingredient.objects.create(name='перец', unit='г')
+        cls.recipe = create_recipes(cls.user, [], 1)[0]
+
+    def setUp(self):
+        cache.clear()
+        ingredient_index.invalidate()
+
+    def assertNotModified(self, url, budget, **headers):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        conditional = self.assertQueryBudget(
+            budget, self.client.get, url,
+            HTTP_IF_NONE_MATCH=response['ETag'], **headers
+        )
+        self.assertEqual(conditional.status_code, 304)
+        return response
+
+    def test_recipes_not_modified(self):
+        self.assertNotModified('/api/recipes/', 0)
+        self.client.force_authenticate(self.user)
+        self.assertNotModified('/api/recipes/', 0)
+        self.client.force_authenticate(None)
+        response = self.assertNotModified(
+            f'/api/recipes/{self.recipe.pk}/', 1
+        )
+        conditional = self.client.get(
+            f'/api/recipes/{self.recipe.pk}/',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        self.assertEqual(conditional.status_code, 304)
+
+    def test_ingredients_not_modified_without_queries(self):
+        self.client.force_authenticate(self.user)
+        self.assertNotModified('/api/ingredients/?name=пе', 0)
+
+    def test_favorite_changes_etag(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.client.post(f'{url}favorite/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+        list_etag = self.client.get('/api/recipes/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'{url}favorite/')
+        response = self.client.get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=list_etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_update_changes_etag(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.client.get(url)['ETag']
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            updated_at=self.recipe.updated_at + timedelta(seconds=1)
+        )
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_ingredient_save_changes_etag(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        item = RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=Ingredient.objects.get(), amount=1
+        )
+        etag = self.client.get(url)['ETag']
+        item.amount = 99
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ingredients'][0]['amount'], 99)
+
+    def test_recipe_save_changes_list_etag(self):
+        etag = self.client.get('/api/recipes/')['ETag']
+        self.recipe.title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.save()
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['results'][0]['title'], 'Новое название'
+        )
+
+
+class KeysetPaginationTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='pager@example.com', username='pager'
+        )
+        cls.recipes = create_recipes(cls.user, [], 7)
+        # Одинаковая дата публикации: порядок решает id.
+        Recipe.objects.filter(pk__in=[
+            recipe.pk for recipe in cls.recipes[2:5]
+        ]).update(pub_date=cls.recipes[2].pub_date)
+        for number in range(5):
+            author = User.objects.create_user(
+                email=f'paged{number}@example.com', username=f'paged{number}'
+            )
+            Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, limit):
+        ids = []
+        params = {'cursor': '', 'limit': limit}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url, params = response.data['next'], None
+        return ids
+
+    def test_recipes_walk_in_order(self):
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/recipes/', 2), expected)
+
+    def test_subscriptions_walk_in_order(self):
+        expected = list(Follow.objects.filter(user=self.user).order_by(
+            '-created_at', '-id'
+        ).values_list('author_id', flat=True))
+        self.assertEqual(
+            self.walk('/api/users/subscriptions/', 2), expected
+        )
+
+    def test_count_is_optional(self):
+        response = self.client.get(
+            '/api/recipes/', {'cursor': '', 'count': 1}
+        )
+        self.assertEqual(response.data['count'], 7)
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeFilterTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='filter@example.com', username='filter'
+        )
+        cls.other = User.objects.create_user(
+            email='other@example.com', username='other'
+        )
+        cls.own = create_recipes(cls.user, [], 2)
+        cls.others = create_recipes(cls.other, [], 3)
+        Favorite.objects.create(user=cls.user, recipe=cls.others[0])
+        Favorite.objects.create(user=cls.user, recipe=cls.own[0])
+        CartItem.objects.create(user=cls.user, recipe=cls.others[0])
+
+    def setUp(self):
+        cache.clear()
+
+    def ids(self, **params):
+        response = self.client.get('/api/recipes/', {**params, 'limit': 50})
+        self.assertEqual(response.status_code, 200)
+        return {recipe['id'] for recipe in response.data['results']}
+
+    def test_author(self):
+        self.assertEqual(
+            self.ids(author=self.other.pk),
+            {recipe.pk for recipe in self.others}
+        )
+
+    def test_flags(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(
+            self.ids(is_favorited=1), {self.own[0].pk, self.others[0].pk}
+        )
+        self.assertEqual(
+            self.ids(
+                is_favorited=1, is_in_shopping_cart=1, author=self.other.pk
+            ),
+            {self.others[0].pk}
+        )
+        self.assertEqual(len(self.ids(is_in_shopping_cart=0)), 4)
+
+    def test_anonymous_flags(self):
+        self.assertEqual(self.ids(is_favorited=1), set())
+        self.assertEqual(len(self.ids(is_in_shopping_cart=0)), 5)
+
+
+class CountersTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='counter@example.com', username='counter'
+        )
+        cls.author = User.objects.create_user(
+            email='popular@example.com', username='popular'
+        )
+
+    def refresh(self, *objects):
+        for obj in objects:
+            obj.refresh_from_db()
+
+    def test_counters_follow_changes(self):
+        recipe = create_recipes(self.author, [], 2)[0]
+        favorite = Favorite.objects.create(user=self.user, recipe=recipe)
+        CartItem.objects.create(user=self.user, recipe=recipe)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.refresh(recipe, self.author)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.cart_count), (1, 1)
+        )
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (2, 1)
+        )
+        favorite.delete()
+        follow.delete()
+        recipe.delete()
+        self.refresh(self.author)
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (1, 0)
+        )
+
+    def test_recount_repairs_drift(self):
+        recipe = create_recipes(self.author, [], 1)[0]
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        Recipe.objects.update(favorites_count=42, cart_count=7)
+        User.objects.update(recipes_count=0, followers_count=3)
+        call_command('recount', stdout=StringIO())
+        self.refresh(recipe, self.author)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.cart_count), (1, 0)
+        )
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (1, 0)
+        )
+
+
+class AdminChangelistQueriesTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='admin'
+        )
+        authors = [
+            User.objects.create_user(
+                email=f'cook{number}@example.com', username=f'cook{number}'
+            )
+            for number in range(3)
+        ]
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', unit='г')
+            for number in range(3)
+        )
+        for author in authors:
+            for recipe in create_recipes(author, ingredients, 3):
+                Favorite.objects.create(user=cls.admin, recipe=recipe)
+                CartItem.objects.create(user=author, recipe=recipe)
+            Follow.objects.create(user=cls.admin, author=author)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists_have_fixed_query_count(self):
+        for model in ('customuser', 'recipe', 'ingredient',
+                      'recipeingredient', 'favorite', 'cartitem', 'follow'):
+            with self.subTest(model=model):
+                response = self.assertQueryBudget(
+                    6, self.client.get, f'/admin/api/{model}/'
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_search_by_recipe_title(self):
+        response = self.client.get(
+            '/admin/api/recipeingredient/', {'q': 'Рецепт 1'}
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_recipe_change_form_uses_autocomplete(self):
+        recipe = Recipe.objects.first()
+        response = self.client.get(f'/admin/api/recipe/{recipe.pk}/change/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'admin-autocomplete')
+
+
+JOB_CALLS = []
+
+
+def record_job(*args, **kwargs):
+    JOB_CALLS.append((args, kwargs))
+
+
+def failing_job():
+    raise RuntimeError('сбой')
+
+
+class JobQueueTest(APITestCase):
+
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_job_claimed_once_and_removed_after_success(self):
+        enqueue(record_job, 1, key='value')
+        jobs = claim('first', 10)
+        self.assertEqual([job.attempts for job in jobs], [1])
+        self.assertEqual(claim('second', 10), [])
+        self.assertTrue(run_job(jobs[0]))
+        self.assertEqual(JOB_CALLS, [((1,), {'key': 'value'})])
+        self.assertFalse(Job.objects.exists())
+
+    def test_failed_job_retried_with_backoff(self):
+        enqueue(failing_job, max_attempts=2)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertFalse(run_job(claim('worker', 1)[0]))
+        job = Job.objects.get()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, job.created_at)
+        self.assertIn('RuntimeError', job.last_error)
+        self.assertEqual(claim('worker', 1), [])
+        Job.objects.update(run_at=job.created_at)
+        with self.assertLogs('api.jobs', 'ERROR'):
+            self.assertFalse(run_job(claim('worker', 1)[0]))
+        self.assertEqual(Job.objects.get().status, Job.FAILED)
+
+    def test_stale_lock_reclaimed(self):
+        enqueue(record_job)
+        claim('crashed', 1)
+        self.assertEqual(claim('other', 1), [])
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+        job, = claim('other', 1)
+        self.assertEqual((job.locked_by, job.attempts), ('other', 2))
+
+
+class RunWorkerTest(TransactionTestCase):
+
+    def test_burst_runs_queue_in_threads(self):
+        JOB_CALLS.clear()
+        for number in range(5):
+            enqueue(record_job, number)
+        out = StringIO()
+        call_command('run_worker', concurrency=3, burst=True, stdout=out)
+        self.assertEqual(
+            sorted(args for args, _ in JOB_CALLS), [(n,) for n in range(5)]
+        )
+        self.assertFalse(Job.objects.exists())
+        self.assertIn('Выполнено задач: 5', out.getvalue())
+
+
+class InstrumentationTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            email='staff@example.com', username='staff', is_staff=True
+        )
+        cls.user = User.objects.create_user(
+            email='visitor@example.com', username='visitor'
+        )
+        create_recipes(cls.staff, [], 2)
+
+    def setUp(self):
+        registry.clear()
+        cache.clear()
+
+    def test_server_timing_only_for_staff(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+        self.client.force_authenticate(self.staff)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/recipes/')
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'app;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/recipes/')
+        self.client.get('/api/recipes/0/')
+        body = self.client.get('/api/_metrics').content.decode()
+        self.assertIn(
+            'foodgram_requests_total{route="recipe-list",method="GET",'
+            'status="200"} 1', body
+        )
+        self.assertIn(
+            'foodgram_requests_total{route="recipe-detail",method="GET",'
+            'status="404"} 1', body
+        )
+        self.assertIn(
+            'foodgram_request_duration_seconds_count{route="recipe-list",'
+            'method="GET"} 1', body
+        )
+
+    def test_metrics_summed_across_workers(self):
+        directory = Path(tempfile.mkdtemp())
+        with override_settings(METRICS_DIR=str(directory)):
+            self.client.get('/api/recipes/')
+            # Файл другого воркера gunicorn.
+            registry.flush()
+            (directory / f'{os.getpid()}.pickle').rename(
+                directory / '1.pickle'
+            )
+            registry.clear()
+            self.client.get('/api/recipes/')
+            body = self.client.get('/api/_metrics').content.decode()
+        self.assertIn(
+            'foodgram_requests_total{route="recipe-list",method="GET",'
+            'status="200"} 2', body
+        )
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token_required(self):
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 404)
+        response = self.client.get(
+            '/api/_metrics', HTTP_AUTHORIZATION='Bearer secret'
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class ReplicaRouterTest(TransactionTestCase):
+
+    def test_reads_follow_context_outside_transactions(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Recipe))
+        token = use_replica('replica1')
+        try:
+            self.assertEqual(router.db_for_read(Recipe), 'replica1')
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(Recipe))
+        finally:
+            reset_replica(token)
+        self.assertEqual(router.db_for_write(Recipe), 'default')
+        self.assertFalse(router.allow_migrate('replica1', 'api'))
+
+
+REPLICA = next(
+    (alias for alias in settings.DATABASES if alias != 'default'), None
+)
+
+
+@skipUnless(REPLICA, 'Нужен второй алиас БД (зеркало default)')
+class ReplicaReadTest(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email='replica@example.com', username='replica'
+        )
+        self.recipe = create_recipes(self.user, [], 1)[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, method, path):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA]) as replica:
+            response = getattr(self.client, method)(path)
+        self.assertLess(response.status_code, 400)
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def test_reads_go_to_replica_until_user_writes(self):
+        with self.settings(DATABASE_REPLICAS=[REPLICA]):
+            primary, replica = self.count_queries('get', '/api/recipes/')
+            self.assertEqual(primary, 0)
+            self.assertGreater(replica, 0)
+            self.count_queries(
+                'post', f'/api/recipes/{self.recipe.pk}/favorite/'
+            )
+            self.assertIn(PIN_COOKIE, self.client.cookies)
+            # Закрепление не зависит от кэша воркера, принявшего запись.
+            cache.clear()
+            primary, replica = self.count_queries('get', '/api/recipes/')
+            self.assertGreater(primary, 0)
+            self.assertEqual(replica, 0)
+
+
+urlpatterns = [
+    path('async/recipes/', async_views.recipe_list),
+    path('async/recipes/<int:pk>/', async_views.recipe_detail),
+    path('async/ingredients/', async_views.ingredient_list),
+    path('async/s/<str:code>/', ashort_link_redirect),
+    path('', include('foodgram.urls')),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncReadViewsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='async@example.com', username='async'
+        )
+        cls.token = Token.objects.create(user=cls.user).key
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, unit='г')
+            for name in ('мука', 'мёд', 'соль')
+        )
+        cls.recipes = create_recipes(cls.user, cls.ingredients, 5)
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[1:4]
+        )
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        ingredient_index.invalidate()
+
+    def auth(self):
+        return {'Authorization': f'Token {self.token}'}
+
+    def assertSameAsSync(self, path, async_response):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        expected = self.client.get(f'/api/{path}').json()
+        self.assertEqual(async_response.status_code, 200)
+        actual = async_response.json()
+        if 'results' in expected:
+            expected, actual = (
+                {key: data[key] for key in ('count', 'results')}
+                for data in (expected, actual)
+            )
+        self.assertEqual(actual, expected)
+
+    async def test_recipe_list_matches_sync_payload(self):
+        path = 'recipes/?limit=2&page=2&is_favorited=1'
+        response = await self.async_client.get(
+            f'/async/{path}', headers=self.auth()
+        )
+        await sync_to_async(self.assertSameAsSync)(path, response)
+        response = await self.async_client.get(
+            '/async/recipes/?limit=2&page=2'
+        )
+        data = response.json()
+        self.assertEqual(data['count'], 5)
+        self.assertTrue(data['previous'].endswith('/async/recipes/?limit=2'))
+        self.assertIn('page=3', data['next'])
+
+    def test_recipe_list_queries(self):
+        # Синхронный тест: ORM асинхронного представления работает
+        # в этом же потоке, и запросы видны CaptureQueriesContext.
+        with CaptureQueriesContext(connection) as ctx:
+            response = async_to_sync(self.async_client.get)(
+                '/async/recipes/', headers=self.auth()
+            )
+        self.assertEqual(response.status_code, 200)
+        # Токен, COUNT, страница рецептов и ингредиенты одним prefetch.
+        self.assertEqual(len(ctx.captured_queries), 4)
+
+    @override_settings(DEBUG=True)
+    def test_instrumented_under_asgi(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = async_to_sync(self.async_client.get)(
+                '/async/recipes/', headers=self.auth()
+            )
+        self.assertIn(
+            f'desc="{len(ctx.captured_queries)} queries"',
+            response['Server-Timing']
+        )
+        self.assertNotIn('app;dur=0.0', response['Server-Timing'])
+
+    async def test_recipe_detail(self):
+        recipe = self.recipes[0]
+        response = await self.async_client.get(
+            f'/async/recipes/{recipe.pk}/'
+        )
+        await sync_to_async(self.assertSameAsSync)(
+            f'recipes/{recipe.pk}/', response
+        )
+        response = await self.async_client.get('/async/recipes/0/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_conditional_get(self):
+        detail = f'/async/recipes/{self.recipes[0].pk}/'
+        for url in ('/async/recipes/', detail):
+            for headers in ({}, self.auth()):
+                # Второй анонимный запрос отвечает из кэша.
+                for _attempt in range(2):
+                    response = await self.async_client.get(
+                        url, headers=headers
+                    )
+                    self.assertEqual(response.status_code, 200)
+                    conditional = await self.async_client.get(url, headers={
+                        **headers, 'If-None-Match': response['ETag']
+                    })
+                    self.assertEqual(conditional.status_code, 304)
+        response = await self.async_client.get(detail)
+        self.assertIn('Last-Modified', response)
+
+    async def test_ingredient_search_requires_token(self):
+        response = await self.async_client.get('/async/ingredients/')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+        response = await self.async_client.get(
+            '/async/ingredients/?name=м', headers=self.auth()
+        )
+        self.assertEqual(
+            [item['name'] for item in response.json()], ['мука', 'мёд']
+        )
+        cached = await self.async_client.get(
+            '/async/ingredients/?name=м',
+            headers={**self.auth(), 'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    async def test_writes_delegated_to_drf(self):
+        recipe = self.recipes[0]
+        response = await self.async_client.patch(
+            f'/async/recipes/{recipe.pk}/', {'title': 'Новое'},
+            content_type='application/json', headers=self.auth()
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        await recipe.arefresh_from_db()
+        self.assertEqual(recipe.title, 'Новое')
+
+    async def test_short_link_redirect(self):
+        recipe = self.recipes[0]
+        short_link_cache.clear()
+        response = await self.async_client.get(
+            f'/async/s/{recipe.short_code}/'
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], f'/recipes/{recipe.pk}')
+        response = await self.async_client.get('/async/s/missing/')
+        self.assertEqual(response.status_code, 404)
+
+
+class WarmUpTest(TestCase):
+
+    def test_warm_up_primes_process_state(self):
+        Ingredient.objects.create(name='сахар', unit='г')
+        ingredient_index.invalidate()
+        built = warm_up()
+        self.assertIn(RecipeReadSerializer, built)
+        self.assertIn(RecipeWriteSerializer, built)
+        with self.assertNumQueries(0):
+            names = [item.name for item in ingredient_index.search('са')]
+        self.assertEqual(names, ['сахар'])
+
+
+class CachedTokenAuthenticationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(
+            email='token@example.com', username='token', password='old-pass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def get_me(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get('/api/users/me/')
+
+    def test_cached_requests_skip_token_query(self):
+        self.assertEqual(self.get_me().status_code, 200)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.get_me().status_code, 200)
+        self.assertFalse(any(
+            'authtoken_token' in query['sql']
+            for query in ctx.captured_queries
+        ))
+        # Второй уровень (общий кэш) обслуживает и асинхронный путь.
+        token_cache.clear()
+        request = RequestFactory().get(
+            '/', headers={'Authorization': f'Token {self.token.key}'}
+        )
+        with self.assertNumQueries(0):
+            user = async_to_sync(async_views.authenticate)(request)
+        self.assertEqual(user, self.user)
+
+    def test_cache_keeps_no_password(self):
+        self.get_me()
+        entry = cache.get(TOKEN_KEY.format(key=self.token.key))
+        self.assertNotIn(self.user.password, entry)
+
+    def test_cached_user_matches_database(self):
+        User.objects.filter(pk=self.user.pk).update(avatar='users/a.png')
+        self.get_me()
+        for _ in range(2):
+            with self.assertNumQueries(0):
+                user, _token = CachedTokenAuthentication().authenticate(
+                    RequestFactory().get('/', headers={
+                        'Authorization': f'Token {self.token.key}'
+                    })
+                )
+            self.assertEqual(
+                (user.email, user.is_staff, user.is_superuser, user.avatar),
+                ('token@example.com', False, False, 'users/a.png')
+            )
+            response = self.get_me()
+            self.assertEqual(response.data['email'], 'token@example.com')
+
+    def test_write_does_not_restore_stale_counters(self):
+        # Токен попадает в кэш, пока подписчиков нет.
+        self.get_me()
+        followers = [
+            User.objects.create_user(
+                email=f'follower{i}@example.com', username=f'follower{i}'
+            )
+            for i in range(3)
+        ]
+        for follower in followers:
+            Follow.objects.create(user=follower, author=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'old-pass',
+                'new_password': 'Kx8-new-pass',
+            })
+        self.assertEqual(response.status_code, 204)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.followers_count, 3)
+
+    def test_logout_invalidates(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me().status_code, 401)
+
+    def test_password_change_invalidates(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'old-pass',
+                'new_password': 'Kx8-new-pass',
+            })
+        self.assertEqual(response.status_code, 204)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/users/set_password/', {
+                'current_password': 'Kx8-new-pass',
+                'new_password': 'Kx8-newer-pass',
+            })
+        self.assertEqual(response.status_code, 204)
+
+    def test_deactivation_and_deletion_invalidate(self):
+        self.get_me()
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.get_me().status_code, 401)
+        self.user.is_active = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertEqual(self.get_me().status_code, 401)
+
+
+class RecipeSearchTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='search@example.com', username='search'
+        )
+        cls.beet, cls.dill = Ingredient.objects.bulk_create([
+            Ingredient(name='Свёкла', unit='г'),
+            Ingredient(name='Укроп', unit='г'),
+        ])
+        cls.soup, cls.salad, cls.pie = create_recipes(cls.user, [], 3)
+        Recipe.objects.filter(pk=cls.soup.pk).update(title='Борщ')
+        Recipe.objects.filter(pk=cls.salad.pk).update(
+            title='Винегрет', text='Почти как борщ, только холодный'
+        )
+        RecipeIngredient.objects.create(
+            recipe=cls.salad, ingredient=cls.beet, amount=1
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_ranked_by_title_then_text(self):
+        self.assertEqual(self.search('борщ'), [self.soup.pk, self.salad.pk])
+        self.assertEqual(self.search('холодный борщ'), [self.salad.pk])
+        self.assertEqual(self.search('пельмени'), [])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_ingredient_names_indexed(self):
+        self.assertEqual(self.search('свёкла'), [self.salad.pk])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=self.pie, ingredient=self.dill, amount=1)
+        ])
+        self.assertEqual(self.search('укроп'), [self.pie.pk])
+        Ingredient.objects.filter(pk=self.dill.pk).update(name='Петрушка')
+        self.assertEqual(self.search('укроп'), [])
+        self.assertEqual(self.search('петрушка'), [self.pie.pk])
+        RecipeIngredient.objects.filter(recipe=self.pie).delete()
+        self.assertEqual(self.search('петрушка'), [])
+
+    def test_recipe_update_reindexed(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(
+            f'/api/recipes/{self.pie.pk}/',
+            {'title': 'Пирог с укропом',
+             'ingredients': [{'id': self.dill.pk, 'amount': 5}]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.search('пирог укроп'), [self.pie.pk])
+        self.pie.delete()
+        self.assertEqual(self.search('пирог'), [])
+
+
+class PantryIndexTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='pantry@example.com', username='pantry'
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, unit='г')
+            for name in ('яйцо', 'молоко', 'мука', 'соль')
+        )
+        cls.egg, cls.milk, cls.flour, cls.salt = ingredients
+        cls.omelette, cls.pancakes, cls.bread = create_recipes(cls.user, [], 3)
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe, ingredients in (
+                (cls.omelette, (cls.egg, cls.milk)),
+                (cls.pancakes, (cls.egg, cls.milk, cls.flour)),
+                (cls.bread, (cls.flour, cls.salt)),
+            )
+            for ingredient in ingredients
+        )
+
+    def setUp(self):
+        pantry_index.invalidate()
+        self.client.force_authenticate(self.user)
+
+    def pantry(self, *ingredients):
+        response = self.client.get('/api/recipes/pantry/', {
+            'ingredients': ','.join(str(item.pk) for item in ingredients)
+        })
+        self.assertEqual(response.status_code, 200, response.content)
+        return [
+            (recipe['id'], recipe['coverage'], recipe['missing'])
+            for recipe in response.json()['results']
+        ]
+
+    def test_rank_matches_brute_force(self):
+        rng = random.Random(7)
+        recipes = {
+            recipe_id: set(rng.sample(range(50), rng.randint(1, 12)))
+            for recipe_id in range(1, 300)
+        }
+        snapshot = PantrySnapshot([], array('H'), {})
+        for recipe_id, ingredients in recipes.items():
+            snapshot = snapshot.with_recipe(recipe_id, ingredients)
+        snapshot = snapshot.with_recipe(5, ())
+        snapshot = snapshot.with_recipe(6, recipes[6] | {1, 2})
+        del recipes[5]
+        recipes[6] |= {1, 2}
+        pantry = set(rng.sample(range(50), 20))
+        expected = sorted(
+            (
+                (recipe_id, len(ingredients & pantry) / len(ingredients),
+                 len(ingredients - pantry))
+                for recipe_id, ingredients in recipes.items()
+                if ingredients & pantry
+            ),
+            key=lambda item: (
+                -item[1], item[2], -len(recipes[item[0]] & pantry), -item[0]
+            )
+        )
+        ranking = snapshot.rank(pantry)
+        self.assertEqual(len(ranking), len(expected))
+        self.assertEqual(ranking[:], expected)
+        self.assertEqual(ranking[10:17], expected[10:17])
+
+    def test_ranked_by_coverage(self):
+        with self.assertNumQueries(3):
+            self.assertEqual(self.pantry(self.egg, self.milk), [
+                (self.omelette.pk, 1.0, 0),
+                (self.pancakes.pk, 0.6667, 1),
+            ])
+        self.assertEqual(self.pantry(self.flour), [
+            (self.bread.pk, 0.5, 1), (self.pancakes.pk, 0.3333, 2),
+        ])
+        response = self.client.get(
+            '/api/recipes/pantry/', {'ingredients': 'яйцо'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_updated_on_save(self):
+        self.pantry(self.salt)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(
+                f'/api/recipes/{self.omelette.pk}/',
+                {'ingredients': [
+                    {'id': self.egg.pk, 'amount': 2},
+                    {'id': self.salt.pk, 'amount': 1},
+                ]},
+                format='json'
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bread.delete()
+        self.assertEqual(
+            self.pantry(self.salt), [(self.omelette.pk, 0.5, 1)]
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeIngredient.objects.create(
+                recipe=self.pancakes, ingredient=self.salt, amount=1
+            )
+        self.assertEqual(self.pantry(self.salt, self.egg), [
+            (self.omelette.pk, 1.0, 0), (self.pancakes.pk, 0.5, 2),
+        ])
+
+
+class ShoppingListTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email='shopper@example.com', username='shopper'
+        )
+        cls.other = User.objects.create_user(
+            email='neighbour@example.com', username='neighbour'
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=name, unit='г')
+            for name in ('мука', 'сахар', 'соль', 'масло')
+        )
+        cls.flour, cls.sugar, cls.salt, cls.butter = cls.ingredients
+        cls.recipes = create_recipes(cls.user, cls.ingredients[:2], 40)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def shopping_list(self, user=None):
+        return dict(
+            ShoppingListItem.objects.filter(user=user or self.user)
+            .values_list('ingredient__name', 'total_amount')
+        )
+
+    def cart(self, recipe, method='post'):
+        response = getattr(self.client, method)(
+            f'/api/recipes/{recipe.pk}/shopping_cart/'
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def assertConsistent(self):
+        self.assertEqual(list(shopping_list_discrepancies()), [])
+
+    def test_cart_post_and_delete(self):
+        first, second = self.recipes[:2]
+        self.cart(first)
+        self.cart(second)
+        self.assertEqual(self.shopping_list(), {'мука': 2, 'сахар': 2})
+        self.cart(first, 'delete')
+        self.assertEqual(self.shopping_list(), {'мука': 1, 'сахар': 1})
+        self.cart(second, 'delete')
+        self.assertEqual(self.shopping_list(), {})
+
+    def test_ingredient_edit_of_carted_recipe(self):
+        recipe = self.recipes[0]
+        CartItem.objects.create(user=self.user, recipe=recipe)
+        CartItem.objects.create(user=self.other, recipe=recipe)
+        CartItem.objects.create(user=self.other, recipe=self.recipes[1])
+        response = self.client.patch(
+            f'/api/recipes/{recipe.pk}/',
+            {'ingredients': [
+                {'id': self.sugar.pk, 'amount': 5},
+                {'id': self.salt.pk, 'amount': 2},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.shopping_list(), {'сахар': 5, 'соль': 2})
+        self.assertEqual(
+            self.shopping_list(self.other),
+            {'мука': 1, 'сахар': 6, 'соль': 2}
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=self.butter, amount=3
+        )
+        item = recipe.recipe_ingredients.get(ingredient=self.salt)
+        item.amount = 4
+        item.save()
+        recipe.recipe_ingredients.get(ingredient=self.sugar).delete()
+        self.assertEqual(self.shopping_list(), {'соль': 4, 'масло': 3})
+        self.assertConsistent()
+
+    def test_recipe_and_user_deletion(self):
+        CartItem.objects.create(user=self.user, recipe=self.recipes[0])
+        CartItem.objects.create(user=self.other, recipe=self.recipes[0])
+        CartItem.objects.create(user=self.other, recipe=self.recipes[1])
+        self.recipes[0].delete()
+        self.assertEqual(self.shopping_list(), {})
+        self.assertEqual(
+            self.shopping_list(self.other), {'мука': 1, 'сахар': 1}
+        )
+        self.other.delete()
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assertConsistent()
+
+    def test_check_command(self):
+        CartItem.objects.create(user=self.user, recipe=self.recipes[0])
+        call_command('check_shopping_lists', stdout=StringIO())
+        ShoppingListItem.objects.filter(ingredient=self.flour).update(
+            total_amount=7
+        )
+        ShoppingListItem.objects.filter(ingredient=self.sugar).delete()
+        with self.assertRaises(CommandError):
+            call_command('check_shopping_lists', stdout=StringIO())
+        call_command('check_shopping_lists', fix=True, stdout=StringIO())
+        self.assertEqual(self.shopping_list(), {'мука': 1, 'сахар': 1})
+        self.assertConsistent()
+
+    def test_admin_bulk_delete(self):
+        admin = User.objects.create_superuser(
+            email='root@example.com', username='root', password='root'
+        )
+        CartItem.objects.create(user=self.user, recipe=self.recipes[0])
+        self.client.force_login(admin)
+        response = self.client.post('/admin/api/recipeingredient/', {
+            'action': 'delete_selected',
+            'post': 'yes',
+            '_selected_action': list(
+                self.recipes[0].recipe_ingredients.filter(
+                    ingredient=self.flour
+                ).values_list('pk', flat=True)
+            ),
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.shopping_list(), {'сахар': 1})
+
+    def test_download_reads_materialized_rows(self):
+        for recipe in self.recipes:
+            CartItem.objects.create(user=self.user, recipe=recipe)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/', {'type': 'csv'}
+            )
+            content = b''.join(response.streaming_content).decode()
+        self.assertEqual(
+            content.splitlines(),
+            ['name,unit,amount', 'мука,г,40', 'сахар,г,40']
+        )
+
+
+@override_settings(
+    BACKGROUND_TASKS_EAGER=True, FEED_FANOUT_MAX_FOLLOWERS=5,
+    FEED_FANOUT_BATCH=2, FEED_BACKFILL_SIZE=2
+)
+class SubscriptionFeedTest(QueryBudgetMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.star, *cls.fans = [
+            User.objects.create_user(
+                email=f'feed{number}@example.com', username=f'feed{number}'
+            )
+            for number in range(8)
+        ]
+        # У автора 5 подписчиков — раскладка в 3 задачи, у звезды 6.
+        for user in (cls.reader, *cls.fans):
+            Follow.objects.create(user=user, author=cls.star)
+        for user in (cls.reader, *cls.fans[:4]):
+            Follow.objects.create(user=user, author=cls.author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.reader)
+
+    def publish(self, author, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            return create_recipes(author, [], count)
+
+    def expected(self, *authors):
+        return list(
+            Recipe.objects.filter(author__in=authors)
+            .order_by('-pub_date', '-id').values_list('id', flat=True)
+        )
+
+    def feed(self, limit=2):
+        ids = []
+        url = f'/api/users/subscriptions/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_fan_out_in_batches(self):
+        self.publish(self.author, 2)
+        for user in (self.reader, *self.fans[:4]):
+            self.assertEqual(
+                list(FeedEntry.objects.filter(user=user).order_by(
+                    '-pub_date', '-recipe'
+                ).values_list('recipe', flat=True)),
+                self.expected(self.author)
+            )
+
+    def test_popular_author_merged_on_read(self):
+        self.publish(self.author, 3)
+        self.publish(self.star, 2)
+        self.publish(self.author, 1)
+        self.assertFalse(
+            FeedEntry.objects.filter(recipe__author=self.star).exists()
+        )
+        self.assertEqual(self.feed(), self.expected(self.author, self.star))
+
+    def test_recipes_kept_when_popularity_changes(self):
+        self.publish(self.author, 2)
+        self.publish(self.star, 2)
+        # Звезда опускается до порога, автор поднимается выше него.
+        Follow.objects.filter(author=self.star, user=self.fans[0]).delete()
+        for fan in self.fans[4:]:
+            Follow.objects.create(user=fan, author=self.author)
+        self.assertEqual(self.feed(), self.expected(self.author, self.star))
+        self.client.force_authenticate(self.fans[1])
+        self.assertEqual(self.feed(), self.expected(self.author, self.star))
+
+    def test_backfill_at_threshold(self):
+        # Шестой подписчик делает автора популярным, но разложенные
+        # рецепты попадают в его ленту ровно один раз.
+        self.publish(self.author, 3)
+        newcomer = self.fans[4]
+        with self.captureOnCommitCallbacks(execute=True):
+            Follow.objects.create(user=newcomer, author=self.author)
+        self.client.force_authenticate(newcomer)
+        self.assertEqual(self.feed(), self.expected(self.author)[:2])
+
+    def test_page_queries(self):
+        self.publish(self.author, 3)
+        self.publish(self.star, 3)
+        response = self.assertQueryBudget(
+            5, self.client.get, '/api/users/subscriptions/feed/'
+        )
+        self.assertEqual(len(response.data['results']), 6)
+        self.assertIsNone(response.data['next'])
+
+    def test_backfill_on_follow_and_cleanup_on_unfollow(self):
+        other = User.objects.create_user(
+            email='newcomer@example.com', username='newcomer'
+        )
+        self.publish(other, 3)
+        self.assertEqual(self.feed(), [])
+        url = f'/api/users/subscriptions/{other.pk}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.feed(), self.expected(other)[:2])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_visible_while_fan_out_in_progress(self):
+        recipe, = create_recipes(self.author, [], 1)
+        # Первая пачка — двум подписчикам, fans[3] ждёт следующих.
+        run_job(claim('test', 1)[0])
+        recipe.refresh_from_db()
+        self.assertFalse(recipe.fanned_out)
+        self.client.force_authenticate(self.fans[3])
+        self.assertEqual(self.feed(), [recipe.pk])
+        while jobs := claim('test', 10):
+            for job in jobs:
+                run_job(job)
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.fanned_out)
+        self.assertEqual(self.feed(), [recipe.pk])
+
+    @override_settings(BACKGROUND_TASKS_EAGER=False)
+    def test_fan_out_queued(self):
+        recipe, = create_recipes(self.author, [], 1)
+        job = Job.objects.get(task='api.feed.fan_out')
+        self.assertEqual(job.args, [recipe.pk])
+        self.assertFalse(FeedEntry.objects.exists())
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .metrics import metrics_view
 
 from .views import (
     RecipeViewSet,
@@ -16,7 +18,21 @@ router.register(
     basename='subscription'
 )
 
-urlpatterns = [
+async_urlpatterns = []
+if settings.ASYNC_READ_VIEWS:
+    from . import async_views
+
+    # Перекрывают маршруты роутера для GET; остальное делегируют DRF.
+    async_urlpatterns = [
+        path('recipes/', async_views.recipe_list, name='recipe-list'),
+        path('recipes/<int:pk>/', async_views.recipe_detail,
+             name='recipe-detail'),
+        path('ingredients/', async_views.ingredient_list,
+             name='ingredient-list'),
+    ]
+
+urlpatterns = async_urlpatterns + [
+    path('_metrics', metrics_view, name='metrics'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,40 +1,180 @@
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
+from django.db.models import (
+    BooleanField, Exists, F, OuterRef, Prefetch, Value, Window
+)
+from django.db.models.functions import RowNumber
 
-from rest_framework import viewsets, mixins, permissions, status, filters
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import viewsets, mixins, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.pagination import PageNumberPagination
 
-from .models import Recipe, Ingredient, Favorite, CartItem, Follow
+from .models import (
+    Recipe, Ingredient, RecipeIngredient, Favorite, CartItem, Follow
+)
 from .serializers import (
     RecipeReadSerializer, RecipeWriteSerializer,
     IngredientSerializer,
-    FavoriteSerializer, CartItemSerializer,
-    SubscriptionSerializer
+    FavoriteSerializer, CartItemSerializer, PantryRecipeSerializer,
+    SubscriptionSerializer, get_recipes_limit
+)
+from .cache import (
+    LIST_VERSION, USER_STATE_VERSION, AnonymousRecipeCacheMixin, get_version
+)
+from .conditional import ConditionalGetMixin, make_etag
+from .feed import feed_sources
+from .filters import RecipeFilter
+from .indexes import ingredient_index, pantry_index
+from .pagination import (
+    FeedPagination, KeysetPagination, KeysetPaginationMixin,
+    LimitPageNumberPagination
 )
 from .permissions import IsAuthorOrReadOnlyPermission
+from .routers import ReplicaReadMixin
+from .shopping_cart import CHUNK_SIZE, FORMATS, shopping_cart_totals
 
 User = get_user_model()
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+def latest(*moments):
+    moments = [moment for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+def pantry_ingredients(request):
+    """Id ингредиентов из ?ingredients=1,2,3 (можно повторять параметр)."""
+    try:
+        ids = {
+            int(value)
+            for values in request.query_params.getlist('ingredients')
+            for value in values.split(',') if value.strip()
+        }
+    except ValueError:
+        raise ValidationError(
+            {'ingredients': ['Ожидаются id ингредиентов через запятую.']}
+        )
+    if not ids:
+        raise ValidationError(
+            {'ingredients': ['Укажите хотя бы один ингредиент.']}
+        )
+    return ids
+
+
+def annotate_recipes(queryset, user):
+    """
+    Один спланированный запрос на страницу: автор через JOIN,
+    ингредиенты одним prefetch, флаги пользователя — через EXISTS.
+    """
+    queryset = queryset.select_related('author').prefetch_related(
+        Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        )
+    )
+    if user.is_anonymous:
+        false = Value(False, output_field=BooleanField())
+        return queryset.annotate(
+            is_favorited=false,
+            is_in_shopping_cart=false,
+            author_is_subscribed=false,
+        )
+    return queryset.annotate(
+        is_favorited=Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        is_in_shopping_cart=Exists(
+            CartItem.objects.filter(user=user, recipe=OuterRef('pk'))
+        ),
+        author_is_subscribed=Exists(
+            Follow.objects.filter(user=user, author=OuterRef('author'))
+        ),
+    )
+
+
+def recipe_list_validators(request, list_version, state_version=None):
+    """
+    ETag списка рецептов. Версия списка сдвигается при любой правке
+    рецептов, авторов и справочника ингредиентов, версия пользователя —
+    при правке его избранного, покупок и подписок: таблицы читать не нужно.
+    """
+    parts = [list_version]
+    if state_version is not None:
+        parts += [request.user.pk, state_version]
+    return make_etag(request, *parts), None
+
+
+def recipe_detail_validators(request, pk):
+    """ETag и Last-Modified рецепта одним запросом без сериализации."""
+    try:
+        state = annotate_recipes(
+            Recipe.objects.filter(pk=pk), request.user
+        ).prefetch_related(None).values_list(
+            'updated_at', 'author__updated_at', 'is_favorited',
+            'is_in_shopping_cart', 'author_is_subscribed'
+        ).first()
+    except (TypeError, ValueError):
+        return None
+    if state is None:
+        return None
+    updated_at, author_updated_at, *flags = state
+    last_modified = latest(
+        updated_at, author_updated_at, ingredient_index.last_modified
+    )
+    if request.user.is_anonymous:
+        return make_etag(request, last_modified), last_modified
+    return make_etag(request, request.user.pk, last_modified, flags), None
+
+
+class RecipeViewSet(ReplicaReadMixin, AnonymousRecipeCacheMixin,
+                    ConditionalGetMixin, KeysetPaginationMixin,
+                    viewsets.ModelViewSet):
     """
-    /api/recipes/            GET, POST
+    /api/recipes/            GET (?author=&is_favorited=&is_in_shopping_cart=),
+                             POST
     /api/recipes/{id}/       GET, PATCH, DELETE
     /api/recipes/{id}/favorite/      POST, DELETE
     /api/recipes/{id}/shopping_cart/ POST, DELETE
     /api/recipes/{id}/get-link/      GET
+    /api/recipes/download_shopping_cart/  GET (?type=txt|csv)
+    /api/recipes/pantry/     GET (?ingredients=1,2,3) — что приготовить
+                             из имеющихся продуктов
+
+    Список: ?page=&limit= или ?cursor=&limit= (пагинация по ключу).
     """
-    queryset = Recipe.objects.all().order_by('-pub_date')
+    queryset = Recipe.objects.all().order_by('-pub_date', '-id')
     permission_classes = [IsAuthorOrReadOnlyPermission]
-    pagination_class = PageNumberPagination
+    pagination_class = LimitPageNumberPagination
+    keyset_ordering = ('-pub_date', '-id')
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = RecipeFilter
+
+    def get_queryset(self):
+        return annotate_recipes(super().get_queryset(), self.request.user)
 
     def get_serializer_class(self):
         if self.action in ('create', 'update', 'partial_update'):
             return RecipeWriteSerializer
         return RecipeReadSerializer
 
+    def get_list_validators(self, request):
+        if isinstance(self.paginator, KeysetPagination):
+            # Курсор и так читает страницу по индексу — ETag не нужен.
+            return None
+        state_version = None
+        if not request.user.is_anonymous:
+            state_version = get_version(
+                USER_STATE_VERSION.format(pk=request.user.pk)
+            )
+        return recipe_list_validators(
+            request, get_version(LIST_VERSION), state_version
+        )
+
+    def get_detail_validators(self, request, pk):
+        return recipe_detail_validators(request, pk)
+
     @action(detail=True,
             methods=['post', 'delete'],
             permission_classes=[permissions.IsAuthenticated])
@@ -67,38 +207,187 @@ class RecipeViewSet(viewsets.ModelViewSet):
         item.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=[permissions.IsAuthenticated])
+    def download_shopping_cart(self, request):
+        file_type = request.query_params.get('type', 'txt')
+        if file_type not in FORMATS:
+            return Response(
+                {'errors': f'Неизвестный формат файла: {file_type}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        render, content_type = FORMATS[file_type]
+        rows = shopping_cart_totals(request.user).iterator(
+            chunk_size=CHUNK_SIZE
+        )
+        response = StreamingHttpResponse(
+            render(rows), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{file_type}"'
+        )
+        return response
+
+    @action(detail=False, methods=['get'])
+    def pantry(self, request):
+        """
+        Рецепты по доле ингредиентов, которые уже есть у пользователя.
+        Ранжирование — по индексу в памяти; из БД читается только
+        текущая страница.
+        """
+        ranked = pantry_index.rank(pantry_ingredients(request))
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(ranked, request, view=self)
+        recipes = annotate_recipes(
+            Recipe.objects.filter(pk__in=[item[0] for item in page]),
+            request.user
+        ).in_bulk()
+        results = []
+        for recipe_id, coverage, missing in page:
+            recipe = recipes.get(recipe_id)
+            # Рецепт могли удалить в другом процессе после построения.
+            if recipe is not None:
+                recipe.coverage = round(coverage, 4)
+                recipe.missing = missing
+                results.append(recipe)
+        serializer = PantryRecipeSerializer(
+            results, many=True,
+            context={**self.get_serializer_context(), 'action': 'list'}
+        )
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True,
             methods=['get'],
             permission_classes=[permissions.AllowAny],
             url_path='get-link')
     def get_link(self, request, pk=None):
         recipe = self.get_object()
-        short_link = request.build_absolute_uri(f'/s/{recipe.short_id}/')
+        short_link = request.build_absolute_uri(f'/s/{recipe.short_code}/')
         return Response({'short-link': short_link})
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, ConditionalGetMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """
-    /api/ingredients/       GET
+    /api/ingredients/       GET (?name= — поиск по началу названия)
     /api/ingredients/{id}/  GET
     """
     queryset = Ingredient.objects.all().order_by('name')
     serializer_class = IngredientSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['^name']
+
+    def get_list_validators(self, request):
+        # Тело строится из снимка индекса — из него же и валидаторы.
+        keys, _, last_modified = ingredient_index.get()
+        return make_etag(request, len(keys), last_modified), last_modified
+
+    def get_detail_validators(self, request, pk):
+        try:
+            updated_at = Ingredient.objects.filter(pk=pk).values_list(
+                'updated_at', flat=True
+            ).first()
+        except (TypeError, ValueError):
+            return None
+        if updated_at is None:
+            return None
+        return make_etag(request, updated_at), updated_at
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, self.get_list_validators(request), self.search
+        )
+
+    def search(self, request):
+        # Поиск по префиксу обслуживается индексом в памяти, без запроса к БД.
+        prefix = (
+            request.query_params.get('name')
+            or request.query_params.get('search', '')
+        )
+        serializer = self.get_serializer(
+            ingredient_index.search(prefix), many=True
+        )
+        return Response(serializer.data)
 
 
-class SubscriptionViewSet(viewsets.GenericViewSet, mixins.ListModelMixin):
+class SubscriptionViewSet(ReplicaReadMixin, KeysetPaginationMixin,
+                          viewsets.GenericViewSet, mixins.ListModelMixin):
     """
-    /api/users/subscriptions/       GET
+    /api/users/subscriptions/       GET (?page= или ?cursor=)
+    /api/users/subscriptions/feed/  GET (?cursor=&limit=) — новые рецепты
+                                    авторов из подписок
     /api/users/{id}/subscribe/      POST, DELETE
     """
     serializer_class = SubscriptionSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = PageNumberPagination
+    pagination_class = LimitPageNumberPagination
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
-        return Follow.objects.filter(user=self.request.user)
+        return Follow.objects.filter(
+            user=self.request.user
+        ).select_related('author').order_by('-created_at', '-id')
+
+    @staticmethod
+    def recipes_preview(author_ids, limit):
+        """
+        Последние `limit` рецептов каждого автора одним оконным запросом:
+        ROW_NUMBER() OVER (PARTITION BY author_id ORDER BY pub_date DESC).
+        """
+        previews = {author_id: [] for author_id in author_ids}
+        if not author_ids or not limit:
+            return previews
+        recipes = Recipe.objects.filter(
+            author_id__in=author_ids
+        ).annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=F('pub_date').desc()
+            )
+        ).filter(
+            row_number__lte=limit
+        ).only(
+            'id', 'author_id', 'title', 'image', 'image_variants',
+            'cooking_time', 'pub_date'
+        ).order_by('author_id', 'row_number')
+        for recipe in recipes:
+            previews[recipe.author_id].append(recipe)
+        return previews
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        follows = page if page is not None else list(queryset)
+        context = self.get_serializer_context()
+        context['recipes_preview'] = self.recipes_preview(
+            [follow.author_id for follow in follows],
+            get_recipes_limit(request)
+        )
+        serializer = self.get_serializer(follows, many=True, context=context)
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        Лента по ключу (pub_date, id): ключи страницы — слиянием таблицы
+        ленты и неразложенных рецептов авторов, рецепты — одним запросом.
+        """
+        paginator = FeedPagination()
+        keys = paginator.paginate_sources(
+            feed_sources(request.user), request, Recipe, ('-pub_date', '-id')
+        )
+        recipes = annotate_recipes(
+            Recipe.objects.filter(pk__in=[pk for _date, pk in keys]),
+            request.user
+        ).in_bulk()
+        serializer = RecipeReadSerializer(
+            # Рецепт могли удалить между чтением ключей и рецептов.
+            [recipes[pk] for _date, pk in keys if pk in recipes], many=True,
+            context={**self.get_serializer_context(), 'action': 'list'}
+        )
+        return paginator.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'], url_path='subscribe')
     def subscribe(self, request, pk=None):
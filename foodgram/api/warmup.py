@@ -0,0 +1,72 @@
+"""
+Прогрев процесса до fork (gunicorn с preload_app): всё, что иначе
+лениво строилось бы на первых запросах каждого воркера, создаётся один
+раз в мастере и делится между воркерами copy-on-write.
+"""
+import logging
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.utils import translation
+from PIL import Image, features
+
+from .indexes import ingredient_index, pantry_index
+
+logger = logging.getLogger(__name__)
+
+
+def iter_views(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_views(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern.callback
+
+
+def serializer_classes(callback):
+    """Классы сериализаторов всех действий представления DRF."""
+    view_class = getattr(callback, 'cls', None)
+    if view_class is None or not hasattr(view_class, 'get_serializer_class'):
+        return
+    actions = getattr(callback, 'actions', None)
+    for action in set(actions.values()) if actions else (None,):
+        view = view_class(**callback.initkwargs)
+        view.action = action
+        view.request = view.format_kwarg = None
+        view.kwargs = {}
+        try:
+            yield view.get_serializer_class()
+        except (AssertionError, AttributeError):
+            # Выбор сериализатора зависит от запроса — пропускаем.
+            continue
+
+
+def warm_up():
+    """
+    Разрешает маршруты, строит карты полей сериализаторов, загружает
+    каталоги переводов, плагины Pillow и индексы в памяти.
+    """
+    resolver = get_resolver()
+    # reverse_dict строится при первом reverse() и в каждом воркере
+    # заново, если не построить его здесь.
+    resolver.reverse_dict
+    built = set()
+    for callback in iter_views(resolver.url_patterns):
+        for serializer_class in serializer_classes(callback):
+            if serializer_class in built:
+                continue
+            built.add(serializer_class)
+            serializer_class(context={}).fields
+    translation.activate(settings.LANGUAGE_CODE)
+    translation.deactivate()
+    Image.init()
+    features.check('webp')
+    try:
+        ingredient_index.get()
+        pantry_index.get()
+    except DatabaseError:
+        logger.warning(
+            'Индексы в памяти не прогреты: БД недоступна', exc_info=True
+        )
+    return built
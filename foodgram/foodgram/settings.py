@@ -36,6 +36,10 @@ CSRF_TRUSTED_ORIGINS = [
 
 AUTH_USER_MODEL = 'api.CustomUser'
 
+# Асинхронные представления чтения (api/async_views.py) для запуска
+# под ASGI/uvicorn: ASYNC_READ_VIEWS=1.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS') == '1'
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -51,17 +55,24 @@ INSTALLED_APPS = [
     'corsheaders',
     'djoser',
     'django_extensions',
+    'django_filters',
 ]
 
 MIDDLEWARE = [
+    "api.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Только синхронная: под ASGI заставила бы каждый запрос уходить
+    # в поток. Статику в этом режиме отдаёт nginx.
+    *(() if ASYNC_READ_VIEWS else (
+        'whitenoise.middleware.WhiteNoiseMiddleware',
+    )),
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "api.middleware.PrimaryPinMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -97,10 +108,39 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # Под ASGI постоянные соединения не переиспользуются между
+        # потоками запросов, поэтому по умолчанию отключены.
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', 0 if ASYNC_READ_VIEWS else 60)
+        ),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host[:port],... Каждая получает
+# алиас replicaN; в тестах реплика — зеркало default.
+DATABASE_REPLICAS = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1
+):
+    host, _, port = address.strip().partition(':')
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'CONN_MAX_AGE': int(os.getenv(
+            'DB_REPLICA_CONN_MAX_AGE', 0 if ASYNC_READ_VIEWS else 300
+        )),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['api.routers.ReplicaRouter']
+
+# Сколько секунд после записи пользователь читает с основной БД.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -150,16 +190,105 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ]
 }
 
+# Кэш токенов (api.authentication): записей в памяти воркера и их TTL,
+# TTL в общем кэше (сек). Локальный TTL — сколько другие воркеры могут
+# принимать токен после выхода или блокировки пользователя.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_LOCAL_TTL = int(os.getenv('AUTH_TOKEN_LOCAL_TTL', 10))
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 300))
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
 DJOSER = {
     'LOGIN_FIELD': 'email',
 }
+
+# Время жизни (сек) индекса ингредиентов в памяти воркера.
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+# Время жизни (сек) индекса подбора рецептов по продуктам в памяти
+# воркера: правки из других процессов видны не позже этого срока.
+PANTRY_INDEX_TTL = int(os.getenv('PANTRY_INDEX_TTL', 300))
+
+# Лента подписок (api.feed): рецепты авторов, у которых не больше
+# FEED_FANOUT_MAX_FOLLOWERS подписчиков, раскладываются по лентам фоновой
+# задачей пачками по FEED_FANOUT_BATCH; рецепты более популярных
+# подмешиваются при чтении. При подписке в ленту попадают последние
+# FEED_BACKFILL_SIZE рецептов автора.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+FEED_FANOUT_BATCH = int(os.getenv('FEED_FANOUT_BATCH', 500))
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', 50))
+
+# Короткие ссылки: размер LRU-кэша код → рецепт и время кэширования
+# редиректа на стороне клиента и nginx (сек).
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_MAX_AGE = int(os.getenv('SHORT_LINK_MAX_AGE', 3600))
+
+# Кэш: по умолчанию в памяти процесса — только для разработки с одним
+# процессом. CACHE_DIR включает файловый кэш, общий для всех воркеров
+# на хосте (check --deploy предупреждает, если он не задан).
+# В кэше — страницы списка по строке запроса, карточки рецептов, версии
+# ключей и запись токена на каждого активного пользователя. Сверх
+# CACHE_MAX_ENTRIES каждая запись вытесняет треть кэша, поэтому лимит
+# (по умолчанию у Django — 300) должен покрывать их все с запасом.
+CACHE_OPTIONS = {
+    'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+}
+if os.getenv('CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR'),
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': CACHE_OPTIONS,
+        }
+    }
+
+# Время жизни (сек) закэшированных ответов рецептов для анонимов.
+RECIPE_CACHE_TIMEOUT = int(os.getenv('RECIPE_CACHE_TIMEOUT', 300))
+
+# Изображения рецептов: лимиты загрузки и размеры уменьшенных копий,
+# которые строятся в фоне (копии вписываются в рамку ширина × высота).
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 5 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(os.getenv('RECIPE_IMAGE_MAX_PIXELS', 25_000_000))
+RECIPE_IMAGE_QUALITY = 80
+RECIPE_IMAGE_VARIANTS = {
+    'detail': (1200, 1200),
+    'list': (480, 480),
+    'thumb': (160, 160),
+}
+
+# Фоновые задачи (api.jobs, manage.py run_worker). EAGER выполняет их
+# сразу после коммита, без воркера. Задержка повтора растёт от BACKOFF
+# вдвое с каждой попыткой; взятая задача, не завершённая за
+# LOCK_TIMEOUT (сек), снова становится доступна.
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER') == '1'
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_MAX_DELAY = 3600
+JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 600))
+
+# Метрики Prometheus на /api/_metrics; с токеном доступ только по
+# заголовку Authorization: Bearer <METRICS_TOKEN>.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+# Общий каталог, через который воркеры gunicorn складывают счётчики
+# (api.metrics): без него /api/_metrics отдаёт данные случайного воркера.
+# Каталог очищают при перезапуске сервиса.
+METRICS_DIR = os.getenv('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
@@ -17,7 +17,16 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from django.conf import settings
+from api.shortlinks import ashort_link_redirect, short_link_redirect
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("api.urls")),
+    path(
+        "s/<str:code>/",
+        ashort_link_redirect
+        if settings.ASYNC_READ_VIEWS else short_link_redirect,
+        name="short-link",
+    ),
 ]
@@ -0,0 +1,40 @@
+"""
+Настройки gunicorn (подхватываются из рабочего каталога автоматически).
+
+Приложение загружается и прогревается в мастере до fork: воркеры
+получают уже импортированные модули, разрешённые маршруты и индексы
+в общих страницах памяти и обслуживают первый запрос без холодного
+старта. Под ASGI: GUNICORN_WORKER_CLASS=uvicorn_worker.UvicornWorker.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1
+))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+preload_app = True
+
+
+def when_ready(server):
+    # Вызывается в мастере после загрузки приложения, до запуска воркеров.
+    from django.core.cache import caches
+    from django.db import connections
+
+    from api.warmup import warm_up
+
+    serializers = warm_up()
+    # Соединения, открытые при прогреве, нельзя делить между процессами.
+    connections.close_all()
+    caches.close_all()
+    # Объекты мастера — в постоянное поколение: сборщик мусора воркеров
+    # не обходит их и не копирует страницы, меняя заголовки объектов.
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        'Приложение прогрето: %d сериализаторов, %d объектов заморожено',
+        len(serializers), gc.get_freeze_count()
+    )